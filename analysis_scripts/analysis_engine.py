@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+from database.builds import get_build
+
+# Bootstrap replicates per interval and the confidence level of the percentile intervals
+BOOTSTRAP_REPLICATES = 2000
+CONFIDENCE = 0.95
+
+
+# Read the label columns and the score columns of a table in a single query
+def load_scores(engine, categories, table_name='classified_data', label_columns=('typ',)):
+    columns = ', '.join([*label_columns, *categories])
+    return pd.read_sql_query(f"SELECT {columns} FROM {table_name}", con=engine)
+
+
+# Refuse memberships that were matched against another build of the table, or against a table whose rows have
+# changed since its build: their row_ids would point at the wrong rows
+def check_keyword_membership(engine, membership_table='keyword_membership', table_name='classified_data'):
+    membership_build, table_build = get_build(engine, membership_table), get_build(engine, table_name)
+    if membership_build is None or table_build is None \
+            or membership_build['source_built_at'] != table_build['built_at']:
+        raise RuntimeError(f"{membership_table} was not built from the current {table_name}; "
+                           f"run analysis_scripts/keyword_filter.py again")
+    with engine.connect() as connection:
+        row_count = connection.exec_driver_sql(f"SELECT COUNT(*) FROM {table_name}").scalar()
+    if row_count != table_build['row_count']:
+        raise RuntimeError(f"{table_name} holds {row_count:,} rows but was built with {table_build['row_count']:,}; "
+                           f"rebuild it with database/combine_data.py and run analysis_scripts/keyword_filter.py "
+                           f"again")
+
+
+# Keyword group memberships with the scores of their rows, in a single query: one row per (row, keyword group).
+# Memberships point at their row by row_id, so repeated (id, typ) rows are each counted once, as separate rows.
+def load_keyword_scores(engine, categories, membership_table='keyword_membership', table_name='classified_data'):
+    check_keyword_membership(engine, membership_table, table_name)
+    columns = ', '.join(f"c.{category}" for category in categories)
+    return pd.read_sql_query(f"SELECT c.id, k.keyword, {columns} FROM {membership_table} k "
+                             f"JOIN {table_name} c ON c.row_id = k.row_id", con=engine)
+
+
+# Scores as a float matrix (n_rows, n_categories); missing values become NaN and never pass a threshold
+def score_matrix(data, categories):
+    return data[categories].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+
+# Number of scores >= each threshold for every category. Each column is sorted once and every threshold is a
+# binary search into it, so a fine sweep (e.g. 0.01 steps) costs about as much as a handful of thresholds.
+def counts_at_or_above(scores, thresholds):
+    thresholds = np.asarray(thresholds, dtype=float)
+    counts = np.empty((len(thresholds), scores.shape[1]), dtype=np.int64)
+    for j in range(scores.shape[1]):
+        column = np.sort(scores[:, j][~np.isnan(scores[:, j])])
+        counts[:, j] = len(column) - np.searchsorted(column, thresholds, side='left')
+    return counts
+
+
+# Number of the (ascending) thresholds each score reaches; missing scores reach none
+def threshold_bins(values, sorted_thresholds):
+    bins = np.searchsorted(sorted_thresholds, values, side='right')
+    return np.where(np.isnan(values), 0, bins)
+
+
+# Number of rows per group in each threshold bin (the number of the ascending thresholds a score reaches), as an
+# array (n_groups, n_thresholds + 1), counted with one bincount
+def bin_histograms(values, codes, n_groups, sorted_thresholds):
+    n_bins = len(sorted_thresholds) + 1
+    bins = threshold_bins(values, sorted_thresholds)
+    return np.bincount(codes * n_bins + bins, minlength=n_groups * n_bins).reshape(n_groups, n_bins)
+
+
+# Counts >= each ascending threshold from bin counts: a reverse cumulative sum over the last axis
+def passing_counts(bin_counts):
+    return bin_counts[..., ::-1].cumsum(axis=-1)[..., ::-1][..., 1:]
+
+
+# Number of scores >= each threshold for every group and category, as an array (n_groups, n_thresholds,
+# n_categories). Each score is binned by the thresholds it reaches, the bins of all groups are counted with one
+# bincount per category, and a reverse cumulative sum over the bins turns them into counts.
+def grouped_counts_at_or_above(scores, codes, n_groups, thresholds):
+    thresholds = np.asarray(thresholds, dtype=float)
+    order = np.argsort(thresholds)
+    counts = np.empty((n_groups, len(thresholds), scores.shape[1]), dtype=np.int64)
+    for j in range(scores.shape[1]):
+        counts[:, order, j] = passing_counts(bin_histograms(scores[:, j], codes, n_groups, thresholds[order]))
+    return counts
+
+
+# Bootstrap percentile intervals of the counts >= each threshold, as two arrays (n_groups, n_thresholds,
+# n_categories) of lower and upper bounds. Resampling the rows of a group with replacement and recounting only
+# changes how many rows fall in each threshold bin, and those bin counts follow a multinomial distribution over the
+# group's observed bin shares. So every replicate is one multinomial draw over the bins, without materializing a
+# resampled score matrix.
+def bootstrap_count_intervals(scores, codes, n_groups, thresholds, replicates=BOOTSTRAP_REPLICATES,
+                              confidence=CONFIDENCE, seed=0):
+    rng = np.random.default_rng(seed)
+    thresholds = np.asarray(thresholds, dtype=float)
+    order = np.argsort(thresholds)
+    tail = (1 - confidence) / 2
+    lower = np.zeros((n_groups, len(thresholds), scores.shape[1]), dtype=np.int64)
+    upper = np.zeros_like(lower)
+    for j in range(scores.shape[1]):
+        histograms = bin_histograms(scores[:, j], codes, n_groups, thresholds[order])
+        for g, histogram in enumerate(histograms):
+            size = histogram.sum()
+            if size == 0:
+                continue
+            draws = passing_counts(rng.multinomial(size, histogram / size, size=replicates))
+            bounds = np.quantile(draws, [tail, 1 - tail], axis=0, method='inverted_cdf')
+            lower[g, order, j], upper[g, order, j] = bounds
+    return lower, upper
+
+
+# Bootstrap interval of a count, appended to a formatted cell
+def format_interval(lower, upper):
+    return f" [{lower:,}-{upper:,}]"
+
+
+def format_count(count, total, interval=None):
+    proportion = (count / total * 100) if total else 0
+    if count <= 0:
+        return "-"
+    return f"{count:,} ({proportion:,.2f}%)" + (format_interval(*interval) if interval else "")
+
+
+# One formatted thresholds x categories table per type plus 'overall', proportions relative to the type's rows.
+# With with_ci every cell also gets the bootstrap interval of its count, resampling within the type.
+def threshold_tables(data, categories, thresholds, types, with_ci=False, replicates=BOOTSTRAP_REPLICATES, seed=0):
+    scores = score_matrix(data, categories)
+    tables = {}
+    for typ in ['overall'] + types:
+        rows = scores if typ == 'overall' else scores[(data['typ'] == typ).to_numpy()]
+        counts = counts_at_or_above(rows, thresholds)
+        if with_ci:
+            lower, upper = bootstrap_count_intervals(rows, np.zeros(len(rows), dtype=np.int64), 1, thresholds,
+                                                     replicates, seed=seed)
+        intervals = [[(lower[0, i, j], upper[0, i, j]) if with_ci else None for j in range(len(categories))]
+                     for i in range(len(thresholds))]
+        tables[typ] = pd.DataFrame([[format_count(count, len(rows), interval) for count, interval in zip(*row)]
+                                    for row in zip(counts, intervals)], index=thresholds, columns=categories)
+    return tables
+
+
+def format_keyword_count(count, total, keyword_total, interval=None):
+    proportion_total = (count / total * 100) if total > 0 else 0
+    proportion_keyword = (count / keyword_total * 100) if keyword_total > 0 else 0
+    if count <= 0:
+        return "-"
+    return f"{count:,} ({proportion_total:.2f}%, {proportion_keyword:.2f}%)" + \
+        (format_interval(*interval) if interval else "")
+
+
+# One formatted thresholds x categories table per keyword group, counted for all groups in one pass. Proportions
+# are relative to the whole dataset and to the rows of the keyword group. With with_ci every cell also gets the
+# bootstrap interval of its count, resampling within the keyword group.
+def keyword_tables(data, categories, thresholds, keyword_groups, total_dataset_size, with_ci=False,
+                   replicates=BOOTSTRAP_REPLICATES, seed=0):
+    codes = pd.Categorical(data['keyword'], categories=keyword_groups).codes.astype(np.int64)
+    known = codes >= 0
+    scores, codes = score_matrix(data, categories)[known], codes[known]
+    counts = grouped_counts_at_or_above(scores, codes, len(keyword_groups), thresholds)
+    group_sizes = np.bincount(codes, minlength=len(keyword_groups))
+    if with_ci:
+        lower, upper = bootstrap_count_intervals(scores, codes, len(keyword_groups), thresholds, replicates,
+                                                 seed=seed)
+
+    def cell(g, i, j):
+        interval = (lower[g, i, j], upper[g, i, j]) if with_ci else None
+        return format_keyword_count(counts[g, i, j], total_dataset_size, group_sizes[g], interval)
+
+    return {group: pd.DataFrame([[cell(g, i, j) for j in range(len(categories))] for i in range(len(thresholds))],
+                                index=thresholds, columns=categories)
+            for g, group in enumerate(keyword_groups)}
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from pathlib import Path
+from analysis_scripts.analysis_engine import load_scores, score_matrix
+
+# Set up the directory path for saving the analysis results.
+base_dir = Path('/Users/j_v_samson/Repos/inequality_classifier/analysis_tables')
+base_dir.mkdir(parents=True, exist_ok=True)  # Ensure the directory exists
+
+# Set up the database connection.
+engine = create_engine('sqlite:////Users/j_v_samson/Repos/inequality_classifier/processed_classified.sqlite')
+
+ARENAS = ['top_bottom', 'inside_outside', 'us_them', 'today_tomorrow']
+FAMILIES = ['multi', 'single']
+
+# Every combination of arenas as a bit code: MEMBERS[code, k] is set when arena k belongs to the combination, and
+# SUPERSETS[subset, code] when the combination contains every arena of the subset
+CODES = np.arange(2 ** len(ARENAS))
+MEMBERS = ((CODES[:, None] >> np.arange(len(ARENAS))) & 1).astype(np.int64)
+SUPERSETS = ((CODES[None, :] & CODES[:, None]) == CODES[:, None]).astype(np.int64)
+
+
+# Bit-packed arena masks: bit k of a row's code is set when its score for arena k reaches the threshold. Missing
+# scores never reach it.
+def arena_codes(scores, threshold):
+    passed = np.nan_to_num(scores, nan=-np.inf) >= threshold
+    return passed.astype(np.int64) @ (1 << np.arange(scores.shape[1]))
+
+
+# Number of rows with each exact arena combination, per group, as an array (n_groups, 16)
+def combination_counts(codes, groups, n_groups):
+    return np.bincount(groups * len(CODES) + codes, minlength=n_groups * len(CODES)).reshape(n_groups, len(CODES))
+
+
+def combination_name(code):
+    return ' + '.join(arena for k, arena in enumerate(ARENAS) if code >> k & 1) or 'none'
+
+
+# Exact and "at least" counts of every arena combination, from the histogram of exact combinations of one group
+def combination_table(histogram):
+    total = histogram.sum()
+    return pd.DataFrame({
+        'arenas': [combination_name(code) for code in CODES],
+        'n_arenas': MEMBERS.sum(axis=1),
+        'rows': histogram,
+        'share': histogram / total * 100 if total else 0.0,
+        'at_least': SUPERSETS @ histogram,
+    })
+
+
+# Pairwise overlap of the arenas, from the histogram of exact combinations of one group: rows in both arenas, their
+# Jaccard index (both / either) and lift (observed overlap over the overlap expected if the arenas were independent)
+def pairwise_table(histogram):
+    total = histogram.sum()
+    both = MEMBERS.T @ (MEMBERS * histogram[:, None])
+    single = np.diag(both)
+    rows = []
+    for a in range(len(ARENAS)):
+        for b in range(a + 1, len(ARENAS)):
+            either = single[a] + single[b] - both[a, b]
+            expected = single[a] * single[b] / total if total else 0
+            rows.append({'arena_a': ARENAS[a], 'arena_b': ARENAS[b], 'rows_a': single[a], 'rows_b': single[b],
+                         'rows_both': both[a, b], 'jaccard': both[a, b] / either if either else np.nan,
+                         'lift': both[a, b] / expected if expected else np.nan})
+    return pd.DataFrame(rows)
+
+
+# Pairwise and combination tables of one score family for every type (and overall) and threshold. The scores are
+# read once; each threshold costs one pass to pack the arena masks and one bincount over all types.
+def cooccurrence_tables(data, family, thresholds, types):
+    scores = score_matrix(data, [f"{family}_{arena}" for arena in ARENAS])
+    type_codes = pd.Categorical(data['typ'], categories=types).codes.astype(np.int64)
+    known = type_codes >= 0
+    pairwise, combinations = [], []
+    for threshold in thresholds:
+        codes = arena_codes(scores, threshold)
+        histograms = np.vstack([combination_counts(codes, np.zeros(len(codes), dtype=np.int64), 1),
+                                combination_counts(codes[known], type_codes[known], len(types))])
+        for typ, histogram in zip(['overall'] + types, histograms):
+            pairwise.append(pairwise_table(histogram).assign(typ=typ, threshold=threshold))
+            combinations.append(combination_table(histogram).assign(typ=typ, threshold=threshold))
+    index = ['typ', 'threshold']
+    return (pd.concat(pairwise, ignore_index=True).set_index(index + ['arena_a', 'arena_b']),
+            pd.concat(combinations, ignore_index=True).set_index(index + ['arenas']))
+
+
+def main():
+    thresholds = [0.95, 0.90, 0.80, 0.70, 0.60, 0.50, 0.40, 0.30]
+    types = ['group', 'channel', 'comment']
+    categories = [f"{family}_{arena}" for family in FAMILIES for arena in ARENAS]
+
+    data = load_scores(engine, categories)
+
+    # One Excel file per score family, with the pairwise overlaps and the arena combinations in separate tabs
+    for family in FAMILIES:
+        pairwise, combinations = cooccurrence_tables(data, family, thresholds, types)
+        excel_path = base_dir / f'cooccurrence_{family}.xlsx'
+        with pd.ExcelWriter(excel_path) as writer:
+            pairwise.to_excel(writer, sheet_name='pairwise')
+            combinations.to_excel(writer, sheet_name='combinations')
+        print(f"Co-occurrence of the {family} scores saved to {excel_path}")
+
+
+if __name__ == "__main__":
+    main()
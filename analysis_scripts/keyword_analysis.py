@@ -1,6 +1,7 @@
 import pandas as pd
 from sqlalchemy import create_engine
 from pathlib import Path
+from analysis_scripts.analysis_engine import load_keyword_scores, keyword_tables
 
 # Set up the directory path for saving the analysis results.
 base_dir = Path('/Users/j_v_samson/Repos/inequality_classifier/analysis_tables')
@@ -10,44 +11,21 @@ base_dir.mkdir(parents=True, exist_ok=True)  # Ensure the directory exists
 engine = create_engine('sqlite:////Users/j_v_samson/Repos/inequality_classifier/processed_classified.sqlite')
 
 
-# Function to analyze data by keyword group and classification category.
-def analyze_by_keyword_group(keyword_group, thresholds, categories, source_table, total_dataset_size):
-    results = {}
-    # Fetch all entries for the given keyword group from the specified table.
-    query = f"SELECT * FROM {source_table} WHERE keyword = '{keyword_group}';"
-    data = pd.read_sql(query, engine)
+# Analyze all keyword groups by classification category. The memberships and scores are read once (no texts) and
+# the counts for all groups, thresholds and categories are computed in memory. With with_ci the cells also get
+# bootstrap intervals, drawn from the same in-memory scores.
+def analyze_keyword_groups(keyword_groups, thresholds, categories, membership_table, source_table,
+                           total_dataset_size, with_ci=False):
+    data = load_keyword_scores(engine, categories, membership_table, source_table)
+    return keyword_tables(data, categories, thresholds, keyword_groups, total_dataset_size, with_ci=with_ci)
 
-    # Ensure all classification columns are numeric; non-numeric entries are converted to NaN.
-    for category in categories:
-        data[category] = pd.to_numeric(data[category], errors='coerce')
 
-    # Count the total entries that have the specific keyword.
-    total_entries_keyword = data.shape[0]
-
-    # Analyze data by category and threshold.
-    for category in categories:
-        results[category] = []
-        for threshold in thresholds:
-            # Count entries that exceed the current threshold.
-            count = data[data[category] >= threshold].dropna().shape[0]
-            # Calculate the percentage of the total dataset that this count represents.
-            proportion_total = (count / total_dataset_size * 100) if total_dataset_size > 0 else 0
-            # Calculate the percentage of the keyword group that this count represents.
-            proportion_keyword = (count / total_entries_keyword * 100) if total_entries_keyword > 0 else 0
-            formatted_output = f"{count:,} ({proportion_total:.2f}%, {proportion_keyword:.2f}%)" if count > 0 else "-"
-            results[category].append(formatted_output)
-
-    # Convert the results dictionary into a DataFrame for easier manipulation and display.
-    df = pd.DataFrame(results, index=thresholds)
-    return df
-
-
-def main():
+def main(with_ci=False):
     # Define the categories and thresholds for classification comparison.
     categories = ['multi_top_bottom', 'multi_inside_outside', 'multi_us_them', 'multi_today_tomorrow',
                   'single_top_bottom', 'single_inside_outside', 'single_us_them', 'single_today_tomorrow']
     thresholds = [0.95, 0.90, 0.80, 0.70, 0.60, 0.50, 0.40, 0.30]
-    filtered_table = 'filtered_data'
+    membership_table = 'keyword_membership'
     source_table = 'classified_data'
     keyword_groups = ['Top-Bottom', 'Inside-Outside', 'Us-Them', 'Today-Tomorrow']
 
@@ -55,11 +33,12 @@ def main():
     total_dataset_size = pd.read_sql(f"SELECT COUNT(*) as total FROM {source_table};", engine).iloc[0]['total']
 
     # Prepare an Excel writer to save each analysis in a different tab.
-    excel_path = base_dir / 'keyword_analysis.xlsx'
+    excel_path = base_dir / ('keyword_analysis_ci.xlsx' if with_ci else 'keyword_analysis.xlsx')
+    results = analyze_keyword_groups(keyword_groups, thresholds, categories, membership_table, source_table,
+                                     total_dataset_size, with_ci)
     with pd.ExcelWriter(excel_path) as writer:
-        # Perform analysis for each keyword group and save it in the Excel file.
-        for group in keyword_groups:
-            df = analyze_by_keyword_group(group, thresholds, categories, filtered_table, total_dataset_size)
+        # Save the analysis of each keyword group in the Excel file.
+        for group, df in results.items():
             df.to_excel(writer, sheet_name=group)
             print(f"Analysis for {group} saved in the sheet: {group}")
 
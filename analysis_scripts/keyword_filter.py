@@ -1,60 +1,58 @@
+import re
 import pandas as pd
-from sqlalchemy import create_engine, MetaData, Table, Column, Float, Text, BIGINT
+from sqlalchemy import create_engine
 from tqdm.auto import tqdm
+from database.builds import get_build, record_build
+from database.streaming import count_rows, iter_batches
 
 # Initialize database connection
 engine = create_engine('sqlite:////Users/j_v_samson/Repos/inequality_classifier/processed_classified.sqlite')
 
-# Reflect the database schema
-metadata = MetaData()
-metadata.reflect(bind=engine)
 
+# One compiled alternation of the escaped keywords per group. A regex search finds a match exactly when one of the
+# group's keywords occurs as a case-sensitive substring, the same test as `word in text`.
+def compile_keyword_patterns(keywords):
+    return {keyword: re.compile('|'.join(re.escape(word) for word in word_list))
+            for keyword, word_list in keywords.items()}
 
-# Function to filter rows based on keywords and add a column indicating the keyword
-def filter_and_add_keyword_column(data, keywords):
-    new_rows = []  # List to store new rows with their keywords
 
-    for _, row in data.iterrows():
-        row['text'] = row['text'] if row['text'] is not None else ''
-        row['english_text'] = row['english_text'] if row['english_text'] is not None else ''
-        keywords_found = set()  # Using a set to avoid duplicating keywords
+# Keyword groups found in the text or English text of each row, as compact (row_id, keyword) membership rows.
+# The row_id identifies the row itself: (id, typ) is not unique in classified_data, which can hold repeated rows.
+def match_keyword_groups(data, patterns):
+    text = data['text'].fillna('').astype(str)
+    english_text = data['english_text'].fillna('').astype(str)
+    memberships = [data.loc[text.str.contains(pattern) | english_text.str.contains(pattern), ['row_id']]
+                   .assign(keyword=keyword) for keyword, pattern in patterns.items()]
+    return pd.concat(memberships, ignore_index=True)
 
-        for keyword, word_list in keywords.items():
-            if any(word in row['text'] or word in row['english_text'] for word in word_list):
-                keywords_found.add(keyword)
 
-        for keyword in keywords_found:
-            new_row = row.copy()  # Copy the original row
-            new_row['keyword'] = keyword  # Add the keyword column
-            new_rows.append(new_row)
+# Stream the texts of a table in bounded batches, match all keyword groups at once, and save the memberships in a
+# new table (rebuilt on every run). Scores are joined back from the source table by row_id when they are analyzed,
+# so the memberships are stamped with the build of the source table they were matched against, and the analysis
+# refuses to run once the source table has been rebuilt (see analysis_engine.check_keyword_membership).
+def process_and_filter(source_table, new_table_name, keywords, batch_size=5000):
+    source_build = get_build(engine, source_table)
+    if source_build is None:
+        raise RuntimeError(f"{source_table} has no build stamp; rebuild it with database/combine_data.py")
+    patterns = compile_keyword_patterns(keywords)
+    total_rows = count_rows(engine, source_table)
+    total_batches = total_rows // batch_size + (total_rows % batch_size != 0)
 
-    # Convert the list of new rows into a DataFrame
-    if new_rows:
-        return pd.DataFrame(new_rows)
-    else:
-        return pd.DataFrame(columns=data.columns.append(pd.Index(['keyword'])))  # Ensure the keyword column is included even in empty DF
-
-
-# Process data from a table, filter based on keywords, and save the results in a new table
-def process_and_filter(source_table, new_table_name, keywords):
-    data = pd.read_sql(f"SELECT * FROM {source_table};", engine)
-    total_batches = len(data) // 500 + (len(data) % 500 != 0)
-
-    if new_table_name not in metadata.tables:
-        columns_from_original = [Column(c.name, BIGINT if isinstance(c.type, BIGINT) else Text) for c in
-                                 metadata.tables[source_table].columns]
-        new_table = Table(new_table_name, metadata, *columns_from_original, Column('keyword', Text))
-        new_table.create(bind=engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {new_table_name}")
+        connection.exec_driver_sql(f"CREATE TABLE {new_table_name} (row_id INTEGER, keyword TEXT)")
 
     pbar_batches = tqdm(total=total_batches, desc=f"Filtering texts in {source_table}")
-    for start in range(0, len(data), 500):
-        end = start + 500
-        batch = data.iloc[start:end].copy()
-        filtered_batch = filter_and_add_keyword_column(batch, keywords)
-        filtered_batch.to_sql(new_table_name, con=engine, if_exists='append', index=False)
+    columns = 'row_id, text, english_text'
+    for batch in iter_batches(engine, source_table, columns=columns, batch_size=batch_size, key='row_id'):
+        match_keyword_groups(batch, patterns).to_sql(new_table_name, con=engine, if_exists='append', index=False)
         pbar_batches.update(1)
-
     pbar_batches.close()
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {new_table_name}_keyword_idx "
+                                   f"ON {new_table_name} (keyword)")
+        record_build(connection, new_table_name, source_built_at=source_build['built_at'])
     print(f"Data from {source_table} filtered and saved in {new_table_name}")
 
 
@@ -78,7 +76,7 @@ def main():
                            'biodivers', 'emissions']
     }
 
-    process_and_filter('classified_data', 'filtered_data', keywords)
+    process_and_filter('classified_data', 'keyword_membership', keywords)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+import hashlib
+from database.sqlite_cache import SQLiteCache, text_hash
+
+CACHE_PATH = '/Users/j_v_samson/Repos/inequality_classifier/classification_cache.sqlite'
+
+# One cache per process, opened when the first batch is classified rather than at import time
+_shared_cache = None
+
+
+# Hash of the full set of hypotheses, so that editing one prompt only invalidates results of that prompt set
+def prompt_set_hash(hypotheses):
+    return hashlib.sha256('\n'.join(hypotheses).encode('utf-8')).hexdigest()
+
+
+# Classification results keyed by (normalized text hash, model id, prompt-set hash, label mode). The prompt-set
+# hash doubles as namespace, so stale prompt sets can be dropped without touching the others.
+class ClassificationCache(SQLiteCache):
+    def __init__(self, db_path=CACHE_PATH, max_entries=2_000_000):
+        super().__init__(db_path, table_name='classification_cache', max_entries=max_entries)
+
+    @staticmethod
+    def key(text, model_name, prompt_hash, label_mode):
+        return f"{text_hash(text)}|{model_name}|{prompt_hash}|{label_mode}"
+
+
+def get_classification_cache():
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ClassificationCache()
+    return _shared_cache
@@ -0,0 +1,371 @@
+import gc
+import time
+import numpy as np
+import torch
+from transformers import pipeline
+from classification_scripts.classification_cache import prompt_set_hash
+
+DEFAULT_MODEL = "MoritzLaurer/deberta-v3-large-zeroshot-v2.0"
+SMALL_MODEL = "MoritzLaurer/deberta-v3-base-zeroshot-v2.0"
+HYPOTHESIS_TEMPLATE = "This example is {}."
+LOGIT_NAMES = ['contradiction', 'entailment']
+
+# Long-text mode: posts longer than WINDOW_TOKENS are split into windows starting WINDOW_STRIDE tokens apart, so
+# consecutive windows overlap by WINDOW_TOKENS - WINDOW_STRIDE tokens. The window leaves room for the hypothesis
+# within the model's 512 positions.
+WINDOW_TOKENS = 384
+WINDOW_STRIDE = 256
+
+# The four inequality arenas of Mau et al., verbalized as zero-shot prompts
+CLASS_PROMPTS = {
+    "top_bottom": "Is this text discussing socio-economic disparities such as wealth or power distribution, income inequality, or class struggles? Does it focus on material resources, standard of living, or the tension between different economic classes, within society?",
+    "inside_outside": "Is this text discussing issues of national belonging, citizenship, immigration, or the distinctions between insiders and outsiders of a society? Is it about integration policies, debates on national identity, or the challenges of open versus closed borders?",
+    "us_them": "Is this text centered on identity-based discrimination or struggles for recognition, particularly involving characteristics like gender, race, or ethnicity? Does it address issues of social recognition and the challenges faced by specific groups based on nationality, gender, or racial identity?",
+    "today_tomorrow": "Is this text focused on ecological sustainability, climate change, and the impact of current decisions on future generations? Does it discuss the temporal aspects of inequality in relation to socio-economic decision making, environmental policies, climate actions, and their long-term effects?"
+}
+
+# Shared classifiers, one per (model, device, dtype, backend), built on first use and reused afterwards. The
+# 'torch' backend is the Hugging Face zero-shot pipeline; 'onnx' runs an exported copy of the model with ONNX
+# Runtime on CPU, where dtype 'int8' selects the dynamically quantized export.
+_classifiers = {}
+
+# Texts classified and seconds spent in the model since the last reset, for the texts/sec figure
+throughput = {'texts': 0, 'seconds': 0.0}
+
+# Texts seen and escalated by the cascade, and the seconds spent in each stage, since the last reset
+cascade_stats = {'texts': 0, 'escalated': 0, 'small_seconds': 0.0, 'large_seconds': 0.0}
+
+
+# Pick the best available device: Apple Silicon GPU, CUDA GPU or CPU
+def default_device():
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cuda:0" if torch.cuda.is_available() else "cpu"
+
+
+# dtype means a floating-point torch dtype (torch.float16 or 'float16') for the torch backend and the quantization
+# ('int8') for the onnx backend; None is full precision for both. Returns the name of the precision that will run
+# and rejects pairs that would crash or silently run another precision.
+def _precision(backend, dtype):
+    if backend not in ('torch', 'onnx'):
+        raise ValueError(f"Unknown backend: {backend}")
+    if dtype is None:
+        return None
+    if backend == 'torch':
+        torch_dtype = getattr(torch, dtype, None) if isinstance(dtype, str) else dtype
+        if isinstance(torch_dtype, torch.dtype) and torch_dtype.is_floating_point:
+            return str(torch_dtype).removeprefix('torch.')
+    elif dtype == 'int8':
+        return dtype
+    raise ValueError(f"dtype {dtype!r} is not supported by the {backend} backend")
+
+
+def _classifier_key(model_name, device, dtype, backend):
+    if backend == 'onnx':
+        device = 'cpu'
+    return model_name, str(device if device is not None else default_device()), _precision(backend, dtype), backend
+
+
+# Model id recorded in the classification cache, so results of different backends or precisions never mix
+def _model_id(model_name, dtype, backend):
+    precision = _precision(backend, dtype)
+    if backend == 'torch' and precision is None:
+        return model_name
+    return f"{model_name}|{backend}|{precision}"
+
+
+# Return the shared classifier for this model, device, dtype and backend, loading it only once per process
+def get_classifier(model_name=DEFAULT_MODEL, device=None, dtype=None, backend='torch'):
+    key = _classifier_key(model_name, device, dtype, backend)
+    if key not in _classifiers:
+        if backend == 'onnx':
+            # ONNX Runtime is optional, only import it when the backend is asked for
+            from classification_scripts.onnx_backend import OnnxClassifier
+            _classifiers[key] = OnnxClassifier(model_name, key[2])
+        else:
+            model_kwargs = {'torch_dtype': getattr(torch, key[2])} if key[2] is not None else {}
+            _classifiers[key] = pipeline("zero-shot-classification", model=model_name, device=key[1],
+                                         **model_kwargs)
+    return _classifiers[key]
+
+
+# Load the model and run one tiny inference so the first real batch does not pay for the setup
+def warm_up(model_name=DEFAULT_MODEL, device=None, dtype=None, backend='torch'):
+    start = time.perf_counter()
+    classifier = get_classifier(model_name, device, dtype, backend)
+    if backend == 'onnx':
+        classifier.logits(classifier.tokenizer(["Warm-up text."], ["warm-up"], return_tensors="np"))
+    else:
+        classifier("Warm-up text.", ["warm-up"], multi_label=True)
+    print(f"Classifier {model_name} ({backend}) ready on {_classifier_key(model_name, device, dtype, backend)[1]} "
+          f"after {time.perf_counter() - start:.1f}s")
+    return classifier
+
+
+# Drop one shared classifier (or all of them if no model is given) and free the memory it held
+def release(model_name=None, device=None, dtype=None, backend='torch'):
+    if model_name is None:
+        _classifiers.clear()
+    else:
+        _classifiers.pop(_classifier_key(model_name, device, dtype, backend), None)
+
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    if torch.backends.mps.is_available():
+        torch.mps.empty_cache()
+
+
+# Index of the entailment logit and of the logit it is contrasted with, as the zero-shot pipeline picks them
+def _entailment_ids(config):
+    entailment_id = -1
+    for label, index in config.label2id.items():
+        if label.lower().startswith("entail"):
+            entailment_id = index
+            break
+    contradiction_id = -1 if entailment_id == 0 else 0
+    return entailment_id, contradiction_id
+
+
+def _softmax(logits, axis=-1):
+    exp = np.exp(logits - logits.max(axis=axis, keepdims=True))
+    return exp / exp.sum(axis=axis, keepdims=True)
+
+
+# Run the NLI model once over many texts and keep the raw logits. All (premise, hypothesis) pairs are flattened,
+# sorted by length so padding stays short, and run through the model batch_size pairs at a time. Returns an array
+# of shape (n_texts, n_prompts, 2) holding the [contradiction, entailment] logits in prompt order; empty texts
+# get NaN logits.
+def _run_model(texts, hypotheses, batch_size, model_name, device, dtype, backend):
+    start = time.perf_counter()
+    classifier = get_classifier(model_name, device, dtype, backend)
+    if backend == 'onnx':
+        config, tensor_type, forward = classifier.config, "np", classifier.logits
+    else:
+        model = classifier.model
+        config, tensor_type = model.config, "pt"
+        forward = lambda encoded: model(**encoded.to(model.device)).logits.float().cpu().numpy()
+    tokenizer = classifier.tokenizer
+    entailment_id, contradiction_id = _entailment_ids(config)
+
+    pairs = [(i, j) for i, text in enumerate(texts) if text.strip() for j in range(len(hypotheses))]
+    pairs.sort(key=lambda pair: len(texts[pair[0]]), reverse=True)
+
+    logits = np.full((len(texts), len(hypotheses), 2), np.nan, dtype=np.float32)
+    with torch.inference_mode():
+        for batch_start in range(0, len(pairs), batch_size):
+            batch = pairs[batch_start:batch_start + batch_size]
+            encoded = tokenizer([texts[i] for i, _ in batch], [hypotheses[j] for _, j in batch],
+                                padding=True, truncation='only_first', return_tensors=tensor_type)
+            output = forward(encoded)
+            rows, cols = zip(*batch)
+            logits[list(rows), list(cols)] = output[:, [contradiction_id, entailment_id]]
+
+    throughput['texts'] += len(texts)
+    throughput['seconds'] += time.perf_counter() - start
+    return logits
+
+
+# Serve the texts already in the cache from disk and compute only the rest, each distinct text once
+def _cached(texts, hypotheses, model_id, label_mode, cache, compute):
+    if cache is None or not texts:
+        return compute(texts)
+
+    prompt_hash = prompt_set_hash(hypotheses)
+    keys = [cache.key(text, model_id, prompt_hash, label_mode) for text in texts]
+    found = cache.get_many([key for key, text in zip(keys, texts) if text.strip()])
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    computed = dict(zip(missing, compute(list(missing.values())))) if missing else {}
+    cache.put_many({key: value.tolist() for key, value in computed.items() if missing[key].strip()},
+                   namespace=prompt_hash)
+
+    return np.stack([computed[key] if key in computed else np.asarray(found[key], dtype=np.float32)
+                     for key in keys])
+
+
+def _hypotheses(class_prompts):
+    return [HYPOTHESIS_TEMPLATE.format(prompt) for prompt in (class_prompts or CLASS_PROMPTS).values()]
+
+
+def _clean(texts):
+    return [text if isinstance(text, str) else '' for text in texts]
+
+
+# Raw [contradiction, entailment] logits of shape (n_texts, n_prompts, 2), served from the cache when given
+def classify_logits(texts, batch_size=32, class_prompts=None, model_name=DEFAULT_MODEL, device=None, dtype=None,
+                    cache=None, backend='torch'):
+    hypotheses = _hypotheses(class_prompts)
+    return _cached(_clean(texts), hypotheses, _model_id(model_name, dtype, backend), 'logits', cache,
+                   lambda batch: _run_model(batch, hypotheses, batch_size, model_name, device, dtype, backend))
+
+
+# Turn [contradiction, entailment] logits into zero-shot scores the way the pipeline does: multi-label scores
+# each prompt on its own, single-label spreads one unit of probability over all prompts
+def scores_from_logits(logits, multi_label=True):
+    if multi_label:
+        return _softmax(logits)[..., 1]
+    return _softmax(logits[..., 1], axis=1)
+
+
+# Both score families and the raw logits of a batch as named columns: multi_<arena>, single_<arena> and
+# logit_<contradiction|entailment>_<arena>
+def score_columns(logits, class_prompts=None):
+    columns = {}
+    for label, multi_label in [('multi', True), ('single', False)]:
+        scores = scores_from_logits(logits, multi_label)
+        for i, key in enumerate(class_prompts or CLASS_PROMPTS):
+            columns[f"{label}_{key}"] = scores[:, i]
+    for i, key in enumerate(class_prompts or CLASS_PROMPTS):
+        for k, logit in enumerate(LOGIT_NAMES):
+            columns[f"logit_{logit}_{key}"] = logits[:, i, k]
+    return columns
+
+
+# Score many texts against the inequality prompts at once; returns an array of shape (n_texts, n_prompts)
+def classify_texts(texts, batch_size=32, multi_label=True, class_prompts=None, model_name=DEFAULT_MODEL,
+                   device=None, dtype=None, cache=None, backend='torch'):
+    hypotheses = _hypotheses(class_prompts)
+    return _cached(_clean(texts), hypotheses, _model_id(model_name, dtype, backend),
+                   'multi' if multi_label else 'single', cache,
+                   lambda batch: scores_from_logits(
+                       _run_model(batch, hypotheses, batch_size, model_name, device, dtype, backend), multi_label))
+
+
+# Two-stage cascade: the small model scores every text, and only texts whose top score falls inside the
+# uncertainty band (inclusive) are scored again by the large model. Returns the logits, taken from whichever
+# model produced the final scores, and the model name of each text's final stage.
+def classify_cascade(texts, band=(0.1, 0.9), small_model=SMALL_MODEL, large_model=DEFAULT_MODEL, multi_label=True,
+                     batch_size=32, class_prompts=None, device=None, dtype=None, cache=None, backend='torch'):
+    texts = _clean(texts)
+    start = time.perf_counter()
+    logits = classify_logits(texts, batch_size, class_prompts, small_model, device, dtype, cache, backend)
+    small_seconds = time.perf_counter() - start
+
+    top_scores = np.nan_to_num(scores_from_logits(logits, multi_label), nan=-1.0).max(axis=1)
+    escalate = np.flatnonzero((top_scores >= band[0]) & (top_scores <= band[1]))
+    start = time.perf_counter()
+    if len(escalate):
+        logits[escalate] = classify_logits([texts[i] for i in escalate], batch_size, class_prompts, large_model,
+                                           device, dtype, cache, backend)
+    large_seconds = time.perf_counter() - start
+
+    stages = np.full(len(texts), small_model, dtype=object)
+    stages[escalate] = large_model
+
+    cascade_stats['texts'] += len(texts)
+    cascade_stats['escalated'] += len(escalate)
+    cascade_stats['small_seconds'] += small_seconds
+    cascade_stats['large_seconds'] += large_seconds
+    return logits, stages
+
+
+# Fraction of texts escalated to the large model and the speedup over running the large model on everything,
+# estimated from the large model's own per-text time on the escalated texts
+def cascade_summary():
+    texts, escalated = cascade_stats['texts'], cascade_stats['escalated']
+    if not texts:
+        return "Cascade: no texts classified"
+    summary = f"Cascade: {escalated:,} of {texts:,} texts escalated ({escalated / texts:.1%})"
+    elapsed = cascade_stats['small_seconds'] + cascade_stats['large_seconds']
+    if escalated and elapsed:
+        large_only_seconds = cascade_stats['large_seconds'] / escalated * texts
+        summary += f", estimated speedup {large_only_seconds / elapsed:.2f}x over the large model alone"
+    return summary
+
+
+def reset_cascade_stats():
+    cascade_stats.update({'texts': 0, 'escalated': 0, 'small_seconds': 0.0, 'large_seconds': 0.0})
+
+
+# Split texts into overlapping token windows and return the window strings with the index of the text each one
+# belongs to. Windows are cut at token offsets of the original string; texts that fit in one window are kept whole.
+# Texts whose token length is already known (token_lengths, NaN or None where unknown) to fit are not tokenized.
+def split_windows(texts, tokenizer, window=WINDOW_TOKENS, stride=WINDOW_STRIDE, token_lengths=None):
+    fits = np.zeros(len(texts), dtype=bool)
+    if token_lengths is not None:
+        fits = np.asarray(token_lengths, dtype=float) <= window
+    to_tokenize = np.flatnonzero(~fits)
+    offsets = {}
+    if len(to_tokenize):
+        encoded = tokenizer([texts[i] for i in to_tokenize], add_special_tokens=False, return_offsets_mapping=True)
+        offsets = dict(zip(to_tokenize, encoded['offset_mapping']))
+
+    windows, owners = [], []
+    for i, text in enumerate(texts):
+        if fits[i] or len(offsets[i]) <= window:
+            windows.append(text)
+            owners.append(i)
+            continue
+        text_offsets = offsets[i]
+        for start in range(0, len(text_offsets), stride):
+            end = min(start + window, len(text_offsets))
+            windows.append(text[text_offsets[start][0]:text_offsets[end - 1][1]])
+            owners.append(i)
+            if end == len(text_offsets):
+                break
+    return windows, np.asarray(owners, dtype=np.int64)
+
+
+# Pool per-window scores into one row per text, taking the max or the mean over each text's windows
+def pool_window_scores(scores, owners, n_texts, pooling='max'):
+    finite = np.isfinite(scores)
+    counts = np.zeros((n_texts, scores.shape[1]))
+    np.add.at(counts, owners, finite)
+    if pooling == 'max':
+        pooled = np.full((n_texts, scores.shape[1]), -np.inf)
+        np.maximum.at(pooled, owners, np.where(finite, scores, -np.inf))
+    elif pooling == 'mean':
+        pooled = np.zeros((n_texts, scores.shape[1]))
+        np.add.at(pooled, owners, np.where(finite, scores, 0.0))
+        pooled = pooled / np.maximum(counts, 1)
+    else:
+        raise ValueError(f"Unknown pooling: {pooling}")
+    return np.where(counts > 0, pooled, np.nan)
+
+
+# Raw logits of every window of every text, scored in the same padded batches, with the index of the text each
+# window belongs to. Both score families can be pooled from the same result, so each window is tokenized and run
+# through the model once.
+def classify_windows(texts, window=WINDOW_TOKENS, stride=WINDOW_STRIDE, batch_size=32, class_prompts=None,
+                     model_name=DEFAULT_MODEL, device=None, dtype=None, cache=None, backend='torch',
+                     token_lengths=None):
+    texts = _clean(texts)
+    tokenizer = get_classifier(model_name, device, dtype, backend).tokenizer
+    windows, owners = split_windows(texts, tokenizer, window, stride, token_lengths)
+    hypotheses = _hypotheses(class_prompts)
+    run = []
+
+    def compute(batch):
+        run.extend(batch)
+        return _run_model(batch, hypotheses, batch_size, model_name, device, dtype, backend)
+
+    logits = _cached(windows, hypotheses, _model_id(model_name, dtype, backend), 'logits', cache, compute)
+    # _run_model counted the windows it ran; texts/sec counts the source texts those windows came from
+    ran = set(run)
+    throughput['texts'] += len({owner for window, owner in zip(windows, owners) if window in ran}) - len(run)
+    return logits, owners
+
+
+# Long-text mode: score every window of every text and pool the per-label scores, so content past the first 512
+# tokens is seen and the cost grows linearly with post length
+def classify_long_texts(texts, window=WINDOW_TOKENS, stride=WINDOW_STRIDE, pooling='max', multi_label=True,
+                        batch_size=32, class_prompts=None, model_name=DEFAULT_MODEL, device=None, dtype=None,
+                        cache=None, backend='torch', token_lengths=None):
+    texts = _clean(texts)
+    logits, owners = classify_windows(texts, window, stride, batch_size, class_prompts, model_name, device, dtype,
+                                      cache, backend, token_lengths)
+    return pool_window_scores(scores_from_logits(logits, multi_label), owners, len(texts), pooling)
+
+
+# Classification throughput since the last reset, in texts per second
+def texts_per_second():
+    return throughput['texts'] / throughput['seconds'] if throughput['seconds'] else 0.0
+
+
+def reset_throughput():
+    throughput['texts'] = 0
+    throughput['seconds'] = 0.0
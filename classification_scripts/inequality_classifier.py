@@ -1,5 +1,6 @@
 import torch
-from transformers import pipeline
+from classification_scripts.classification_cache import get_classification_cache
+from classification_scripts.classifier_engine import get_classifier, classify_texts
 
 
 def classify_text(text, classification_columns):
@@ -16,9 +17,7 @@ def classify_text(text, classification_columns):
                           us_them_inequalities,
                           today_tomorrow_inequalities]
     device = "mps" if torch.backends.mps.is_available() else "cpu"
-    zeroshot_classifier = pipeline("zero-shot-classification",
-                                   model="MoritzLaurer/deberta-v3-large-zeroshot-v2.0",
-                                   device=device)
+    zeroshot_classifier = get_classifier(device=device)
 
     print("Classifying text...")
     output = zeroshot_classifier(text, classes_verbalized,  multi_label=False)
@@ -35,7 +34,12 @@ def classify_text(text, classification_columns):
 # print(classification_result)'
 
 
-def classify_text(text, classification_columns, multi_label=False):
+# Use the GPU if available
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# backend 'onnx' (with dtype 'int8' for the quantized export) trades some fidelity for speed; see onnx_backend
+def classify_text(text, classification_columns, multi_label=False, backend='torch', dtype=None):
     if not text.strip():  # Check if text is empty
         return {column: 0 for column in classification_columns}
 
@@ -47,15 +51,10 @@ def classify_text(text, classification_columns, multi_label=False):
         "today_tomorrow_inequalities": "Is this text focused on ecological sustainability, climate change, and the impact of current decisions on future generations? Does it discuss the temporal aspects of inequality in relation to socio-economic decision making, environmental policies, climate actions, and their long-term effects?"
     }
 
-    # Use the GPU if available
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"Using device: {device}")
-    classifier = pipeline("zero-shot-classification", model="MoritzLaurer/deberta-v3-large-zeroshot-v2.0",
-                          device=device)
-
     # Classify text
-    results = classifier(text, list(class_prompts.values()), multi_label=multi_label)
-    return {classification_columns[i]: results['scores'][i] for i in range(len(class_prompts))}
+    scores = classify_texts([text], multi_label=multi_label, class_prompts=class_prompts, device=device,
+                            dtype=dtype, cache=get_classification_cache(), backend=backend)[0]
+    return {classification_columns[i]: float(scores[i]) for i in range(len(class_prompts))}
 
 
 def process_table_and_classify(engine, table_name, multi_label=False):
@@ -2,8 +2,13 @@ import pandas as pd
 import torch
 from sqlalchemy import create_engine, MetaData, Table, Column, Float, Integer, Text, BIGINT
 from tqdm.auto import tqdm
-from transformers import pipeline
 from accelerate import Accelerator
+from database.checkpoints import resumable_batches, save_batch
+from database.streaming import ensure_index
+from classification_scripts.classification_cache import get_classification_cache
+from classification_scripts.classifier_engine import CLASS_PROMPTS, DEFAULT_MODEL, LOGIT_NAMES, WINDOW_TOKENS, \
+    WINDOW_STRIDE, classify_logits, classify_windows, pool_window_scores, scores_from_logits, classify_cascade, \
+    score_columns, texts_per_second, reset_throughput, cascade_summary, reset_cascade_stats, warm_up, release
 
 # Initialize database connections
 source_engine = create_engine('sqlite:////Users/j_v_samson/Repos/inequality_classifier/detected_language.sqlite')
@@ -19,62 +24,97 @@ target_metadata.reflect(bind=target_engine)
 accelerator = Accelerator(device_placement=True, cpu=True if not torch.backends.mps.is_available() else False)
 print(f"Using device: {accelerator.device}")
 
-
-# Classification function using Hugging Face transformers
-def classify_text(text, multi_label):
-    if not text.strip():
-        return None  # No classification if text is empty
-
-    classifier = pipeline("zero-shot-classification", model="MoritzLaurer/deberta-v3-large-zeroshot-v2.0",
-                          device=accelerator.device)
-    class_prompts = {
-        "top_bottom": "Is this text discussing socio-economic disparities such as wealth or power distribution, income inequality, or class struggles? Does it focus on material resources, standard of living, or the tension between different economic classes, within society?",
-        "inside_outside": "Is this text discussing issues of national belonging, citizenship, immigration, or the distinctions between insiders and outsiders of a society? Is it about integration policies, debates on national identity, or the challenges of open versus closed borders?",
-        "us_them": "Is this text centered on identity-based discrimination or struggles for recognition, particularly involving characteristics like gender, race, or ethnicity? Does it address issues of social recognition and the challenges faced by specific groups based on nationality, gender, or racial identity?",
-        "today_tomorrow": "Is this text focused on ecological sustainability, climate change, and the impact of current decisions on future generations? Does it discuss the temporal aspects of inequality in relation to socio-economic decision making, environmental policies, climate actions, and their long-term effects?"
-    }
-    results = classifier(text, list(class_prompts.values()), multi_label=multi_label)
-    return {f"{'multi' if multi_label else 'single'}_{key}": value for key, value in
-            zip(class_prompts.keys(), results['scores'])}
-
-
-# Process data from a table, classify texts, and save the results in a new table
-def process_and_classify(source_engine, target_engine, source_table, text_column, new_table_name):
-    data = pd.read_sql(f"SELECT * FROM {source_table} WHERE detected_language = 'en';", source_engine)
-    total_batches = len(data) // 500 + (len(data) % 500 != 0)
-
+# Top scores of the small model that count as uncertain and are escalated to the large model in cascade mode
+UNCERTAINTY_BAND = (0.1, 0.9)
+
+
+# Run the model once per batch and derive both the multi-label and single-label scores from the same logits.
+# The raw logits are stored as well, so another normalization can be applied later without re-running inference.
+# In cascade mode a small model scores the batch first and only uncertain texts go to the large model; the
+# model that produced each row's scores is recorded either way.
+# In long-text mode every post is scored over overlapping windows (window_tokens long, stride apart), once, and
+# both score families are pooled from the same window logits; the logit columns stay empty then, because a pooled
+# score does not come from a single forward pass. Posts whose stored token length fits in one window are not
+# tokenized again.
+def classify_batch(texts, cascade=False, long_text=False, backend='torch', dtype=None, token_lengths=None,
+                   window_tokens=WINDOW_TOKENS, stride=WINDOW_STRIDE, pooling='max'):
+    cache = get_classification_cache()
+    if long_text:
+        logits, owners = classify_windows(texts.tolist(), window_tokens, stride, device=accelerator.device,
+                                          dtype=dtype, cache=cache, backend=backend, token_lengths=token_lengths)
+        columns = {}
+        for label, multi_label in [('multi', True), ('single', False)]:
+            scores = pool_window_scores(scores_from_logits(logits, multi_label), owners, len(texts), pooling)
+            columns.update({f"{label}_{key}": scores[:, i] for i, key in enumerate(CLASS_PROMPTS)})
+        return pd.DataFrame({**columns, 'classification_model': DEFAULT_MODEL}, index=texts.index)
+    if cascade:
+        logits, models = classify_cascade(texts.tolist(), band=UNCERTAINTY_BAND, device=accelerator.device,
+                                          dtype=dtype, cache=cache, backend=backend)
+    else:
+        logits = classify_logits(texts.tolist(), device=accelerator.device, dtype=dtype, cache=cache,
+                                 backend=backend)
+        models = DEFAULT_MODEL
+    return pd.DataFrame({**score_columns(logits), 'classification_model': models}, index=texts.index)
+
+
+# Texts to classify and their token lengths. Rows preprocessed by language_scripts.preprocessing carry the
+# normalized text and its token length, so the normalized text is classified (the text the length was measured
+# on); other rows fall back to the raw text with an unknown (NaN) length.
+def texts_to_classify(batch, text_column):
+    if text_column != 'text' or 'normalized_text' not in batch or 'token_length' not in batch:
+        return batch[text_column], None
+    preprocessed = batch['normalized_text'].notna()
+    texts = batch['normalized_text'].where(preprocessed, batch[text_column])
+    return texts, pd.to_numeric(batch['token_length'], errors='coerce').where(preprocessed).to_numpy(dtype=float)
+
+
+# Stream a table in bounded batches, classify texts, and save the results in a new table, resuming where an
+# earlier run stopped (see database.checkpoints.resumable_batches)
+def process_and_classify(source_engine, target_engine, source_table, text_column, new_table_name, resume=True,
+                         cascade=False, long_text=False, backend='torch', dtype=None, window_tokens=WINDOW_TOKENS,
+                         stride=WINDOW_STRIDE, pooling='max'):
+    reset_throughput()
+    reset_cascade_stats()
     if new_table_name not in target_metadata.tables:
         columns_from_original = [Column(c.name, BIGINT if isinstance(c.type, BIGINT) else Text) for c in
                                  source_metadata.tables[source_table].columns]
         classification_columns = [Column(f"{label}_{key}", Float) for label in ['multi', 'single'] for key in
-                                  ['top_bottom', 'inside_outside', 'us_them', 'today_tomorrow']]
-        new_table = Table(new_table_name, target_metadata, *columns_from_original, *classification_columns)
+                                  CLASS_PROMPTS]
+        logit_columns = [Column(f"logit_{logit}_{key}", Float) for key in CLASS_PROMPTS for logit in LOGIT_NAMES]
+        new_table = Table(new_table_name, target_metadata, *columns_from_original, *classification_columns,
+                          *logit_columns, Column('classification_model', Text))
         new_table.create(bind=target_engine)
+    ensure_index(source_engine, source_table, 'id')
+    total_batches, batches = resumable_batches(source_engine, target_engine, source_table, new_table_name,
+                                               where="detected_language = 'en'", resume=resume)
 
     pbar_batches = tqdm(total=total_batches, desc=f"Classifying texts in {source_table}")
-    for start in range(0, len(data), 500):
-        end = start + 500
-        batch = data.iloc[start:end].copy()
-        batch['multi_results'] = batch[text_column].apply(lambda x: classify_text(x, True))
-        batch['single_results'] = batch[text_column].apply(lambda x: classify_text(x, False))
-
-        for classification_type in ['multi_results', 'single_results']:
-            for key in ['top_bottom', 'inside_outside', 'us_them', 'today_tomorrow']:
-                batch[f"{classification_type.split('_')[0]}_{key}"] = batch[classification_type].apply(
-                    lambda x: x[f"{classification_type.split('_')[0]}_{key}"] if x else None)
-
-        columns_to_insert = [c.name for c in target_metadata.tables[new_table_name].columns]
-        batch = batch[columns_to_insert]
-        batch.to_sql(new_table_name, con=target_engine, if_exists='append', index=False)
+    for batch in batches:
+        if not batch.empty:
+            texts, token_lengths = texts_to_classify(batch, text_column)
+            classified = classify_batch(texts, cascade, long_text, backend, dtype, token_lengths, window_tokens,
+                                        stride, pooling)
+            batch = pd.concat([batch, classified], axis=1)
+
+            columns_to_insert = [c.name for c in target_metadata.tables[new_table_name].columns]
+            batch = batch.reindex(columns=columns_to_insert)
+            save_batch(batch, target_engine, source_table, new_table_name, resume)
         pbar_batches.update(1)
 
     pbar_batches.close()
     print(f"Data from {source_table} classified and saved in {new_table_name}")
+    print(f"Classification throughput: {texts_per_second():.1f} texts/sec, "
+          f"cache: {get_classification_cache().stats()}")
+    if cascade:
+        print(cascade_summary())
 
 
 # Main function to execute the process
-def main():
-    process_and_classify(source_engine, target_engine, 'group_processed', 'text', 'group_processed_twice')
+def main(backend='torch', dtype=None):
+    warm_up(device=accelerator.device, dtype=dtype, backend=backend)
+    process_and_classify(source_engine, target_engine, 'group_processed', 'text', 'group_processed_twice',
+                         backend=backend, dtype=dtype)
+    release()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+import time
+import numpy as np
+import onnxruntime as ort
+import torch
+from pathlib import Path
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from sqlalchemy import create_engine
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+from database.streaming import iter_batches
+from classification_scripts.classifier_engine import DEFAULT_MODEL, classify_logits, scores_from_logits, warm_up
+
+# Exported models are written once and reused by every later run
+onnx_dir = Path('/Users/j_v_samson/Repos/inequality_classifier/onnx_models')
+
+# Model inputs in the order of the Hugging Face forward() signature
+INPUT_ORDER = ['input_ids', 'attention_mask', 'token_type_ids']
+
+
+# Export the sequence-classification model to ONNX (once), optionally followed by dynamic int8 quantization of
+# the weights. Returns the path of the requested file.
+def export_onnx(model_name=DEFAULT_MODEL, quantize=False):
+    onnx_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = onnx_dir / f"{model_name.replace('/', '__')}.onnx"
+    int8_path = onnx_dir / f"{model_name.replace('/', '__')}-int8.onnx"
+
+    if not fp32_path.exists():
+        print(f"Exporting {model_name} to {fp32_path}...")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name, torchscript=True).eval()
+        input_names = [name for name in INPUT_ORDER if name in tokenizer.model_input_names]
+        dummy = tokenizer(["A premise."], ["A hypothesis."], return_tensors="pt")
+        torch.onnx.export(model, tuple(dummy[name] for name in input_names), str(fp32_path),
+                          input_names=input_names, output_names=['logits'],
+                          dynamic_axes={**{name: {0: 'batch', 1: 'sequence'} for name in input_names},
+                                        'logits': {0: 'batch'}},
+                          opset_version=14)
+
+    if quantize and not int8_path.exists():
+        print(f"Quantizing {fp32_path} to int8...")
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+
+    return int8_path if quantize else fp32_path
+
+
+# ONNX Runtime counterpart of the zero-shot pipeline as far as the classifier engine needs it: the tokenizer, the
+# model config (for the entailment label) and a logits() call on a batch of numpy-encoded pairs
+class OnnxClassifier:
+    def __init__(self, model_name=DEFAULT_MODEL, dtype=None, threads=None):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.config = AutoConfig.from_pretrained(model_name)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_path = export_onnx(model_name, quantize=dtype == 'int8')
+        self.session = ort.InferenceSession(str(model_path), options, providers=['CPUExecutionProvider'])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def logits(self, encoded):
+        feeds = {name: np.asarray(encoded[name], dtype=np.int64) for name in self.input_names}
+        return self.session.run(['logits'], feeds)[0].astype(np.float32)
+
+
+# Score a fixed sample with PyTorch and with ONNX Runtime and report how far the scores drift apart and how
+# fast each backend is, so speed and fidelity can be weighed per run
+def check_agreement(texts, model_name=DEFAULT_MODEL, dtype='int8', batch_size=32):
+    warm_up(model_name, device='cpu')
+    warm_up(model_name, dtype=dtype, backend='onnx')
+
+    start = time.perf_counter()
+    reference = classify_logits(texts, batch_size, model_name=model_name, device='cpu')
+    torch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidate = classify_logits(texts, batch_size, model_name=model_name, dtype=dtype, backend='onnx')
+    onnx_seconds = time.perf_counter() - start
+
+    drift = {}
+    for label, multi_label in [('multi', True), ('single', False)]:
+        difference = np.abs(scores_from_logits(reference, multi_label) - scores_from_logits(candidate, multi_label))
+        drift[label] = float(np.nanmax(difference)) if np.isfinite(difference).any() else 0.0
+
+    print(f"ONNX ({dtype or 'fp32'}) vs PyTorch on {len(texts)} texts: "
+          f"max abs score drift {drift['multi']:.4f} multi-label, {drift['single']:.4f} single-label")
+    print(f"PyTorch {len(texts) / torch_seconds:.1f} texts/sec, ONNX {len(texts) / onnx_seconds:.1f} texts/sec")
+    return drift
+
+
+def main():
+    # Fixed sample: the first 200 English posts by id
+    engine = create_engine('sqlite:////Users/j_v_samson/Repos/inequality_classifier/detected_language.sqlite')
+    sample = next(iter_batches(engine, 'channel_processed', where="detected_language = 'en'", key='id',
+                               batch_size=200))
+    for dtype in [None, 'int8']:
+        check_agreement(sample['text'].tolist(), dtype=dtype)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import time
+import pandas as pd
+import torch
+from pathlib import Path
+from sqlalchemy import create_engine
+from database.checkpoints import get_high_water_mark, upsert_batch, ensure_unique_key
+from database.streaming import ensure_index, iter_batches
+from classification_scripts.classification_cache import get_classification_cache
+from classification_scripts.classifier_engine import classify_logits, score_columns, warm_up
+
+# Source and target databases, and the directory where every worker writes its own shard database
+source_url = 'sqlite:////Users/j_v_samson/Repos/inequality_classifier/detected_language.sqlite'
+target_url = 'sqlite:////Users/j_v_samson/Repos/inequality_classifier/processed_classified.sqlite'
+shard_dir = Path('/Users/j_v_samson/Repos/inequality_classifier/shards')
+
+WHERE_ENGLISH = "detected_language = 'en'"
+
+
+# Split the rows to classify into n contiguous id ranges of (almost) equal size. The split only depends on the
+# ids in the table, so a restarted run gets the same shards and every worker can resume its own checkpoint.
+def shard_ranges(engine, table_name, n_shards, where=WHERE_ENGLISH):
+    query = f"SELECT MIN(id), MAX(id), COUNT(*) FROM " \
+            f"(SELECT id, NTILE({n_shards}) OVER (ORDER BY id) AS shard FROM {table_name} WHERE {where}) " \
+            f"GROUP BY shard ORDER BY shard"
+    with engine.connect() as connection:
+        return [tuple(row) for row in connection.exec_driver_sql(query)]
+
+
+# Worker process: classify one id range with its own model copy and a fixed number of torch threads, and
+# upsert the results into the worker's own shard database so workers never contend for the same write lock
+def _classify_shard(job):
+    torch.set_num_threads(job['threads'])
+    source_engine = create_engine(job['source_url'])
+    shard_engine = create_engine(f"sqlite:///{job['shard_path']}")
+    cache = get_classification_cache() if job['use_cache'] else None
+    warm_up(device='cpu', dtype=job['dtype'], backend=job['backend'])
+
+    where = f"{WHERE_ENGLISH} AND id BETWEEN {job['first_id']} AND {job['last_id']}"
+    high_water_id = get_high_water_mark(shard_engine, job['source_table'], job['target_table'])
+    rows, start = 0, time.perf_counter()
+    for batch in iter_batches(source_engine, job['source_table'], where=where, key='id', after=high_water_id):
+        logits = classify_logits(batch[job['text_column']].tolist(), device='cpu', dtype=job['dtype'], cache=cache,
+                                 backend=job['backend'])
+        batch = pd.concat([batch, pd.DataFrame(score_columns(logits), index=batch.index)], axis=1)
+        upsert_batch(batch, shard_engine, job['source_table'], job['target_table'])
+        rows += len(batch)
+    return {'shard': job['shard'], 'rows': rows, 'seconds': time.perf_counter() - start}
+
+
+# Single-process reference throughput (one worker using every core) on a sample of the table, used to report
+# how well the sharded run scales with the number of workers
+def _measure_baseline(job):
+    torch.set_num_threads(job['threads'])
+    source_engine = create_engine(job['source_url'])
+    sample = next(iter_batches(source_engine, job['source_table'], where=WHERE_ENGLISH, key='id',
+                               batch_size=job['sample_size']), None)
+    if sample is None:
+        return 0.0
+    warm_up(device='cpu', dtype=job['dtype'], backend=job['backend'])
+    start = time.perf_counter()
+    classify_logits(sample[job['text_column']].tolist(), device='cpu', dtype=job['dtype'], backend=job['backend'])
+    return len(sample) / (time.perf_counter() - start)
+
+
+# Copy every shard database into the target table with idempotent upserts, one transaction per shard. A target
+# left by earlier append-only runs is brought up to date first: columns it lacks (such as the logit columns) are
+# added, and duplicate ids are dropped before the unique index is created.
+def merge_shards(target_engine, target_table, shard_paths):
+    with target_engine.connect() as connection:
+        for shard_path in shard_paths:
+            connection.exec_driver_sql(f"ATTACH DATABASE '{shard_path}' AS shard")
+            columns = {row[1]: row[2] for row in
+                       connection.exec_driver_sql(f"PRAGMA shard.table_info({target_table})")}
+            if columns:
+                column_list = ', '.join(f'"{column}"' for column in columns)
+                connection.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS main.{target_table} AS "
+                                           f"SELECT {column_list} FROM shard.{target_table} WHERE 0")
+                existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA main.table_info({target_table})")}
+                for column, column_type in columns.items():
+                    if column not in existing:
+                        connection.exec_driver_sql(f'ALTER TABLE main.{target_table} '
+                                                   f'ADD COLUMN "{column}" {column_type}')
+                ensure_unique_key(connection, target_table)
+                connection.exec_driver_sql(f"INSERT OR REPLACE INTO main.{target_table} ({column_list}) "
+                                           f"SELECT {column_list} FROM shard.{target_table}")
+                connection.commit()
+            connection.exec_driver_sql("DETACH DATABASE shard")
+
+
+# Per-shard and aggregate throughput. The aggregate rate is measured over the slowest shard's compute time, so
+# process start-up and model loading do not distort the comparison with the single-process baseline.
+def _print_scaling_report(results, workers, wall_seconds, baseline):
+    total_rows = sum(result['rows'] for result in results)
+    for result in sorted(results, key=lambda r: r['shard']):
+        rate = result['rows'] / result['seconds'] if result['seconds'] else 0.0
+        print(f"Shard {result['shard']}: {result['rows']:,} texts in {result['seconds']:.1f}s ({rate:.1f} texts/sec)")
+
+    span = max((result['seconds'] for result in results), default=0.0)
+    aggregate = total_rows / span if span else 0.0
+    print(f"Total: {total_rows:,} texts with {workers} workers, {aggregate:.1f} texts/sec "
+          f"({wall_seconds:.1f}s wall time including model loading)")
+    if baseline and aggregate:
+        speedup = aggregate / baseline
+        print(f"Single-process baseline: {baseline:.1f} texts/sec, speedup {speedup:.2f}x, "
+              f"scaling efficiency {speedup / workers:.0%}")
+
+
+# Classify a table with several worker processes, one deterministic id-range shard each, then merge the shards
+# into the target table. CPU cores are split evenly between the workers' torch thread pools; every worker
+# loads its own copy of the model, so the worker count is bounded by memory as much as by cores.
+def process_and_classify_sharded(source_table, text_column, target_table, workers=4, use_cache=True,
+                                 calibrate=True, sample_size=64, backend='torch', dtype=None):
+    cores = os.cpu_count() or 1
+    source_engine = create_engine(source_url)
+    target_engine = create_engine(target_url)
+    ensure_index(source_engine, source_table, 'id')
+    shard_dir.mkdir(parents=True, exist_ok=True)
+
+    context = multiprocessing.get_context('spawn')
+    baseline = 0.0
+    if calibrate:
+        with context.Pool(1) as pool:
+            baseline = pool.apply(_measure_baseline, ({'source_url': source_url, 'source_table': source_table,
+                                                       'text_column': text_column, 'threads': cores,
+                                                       'sample_size': sample_size, 'backend': backend,
+                                                       'dtype': dtype},))
+
+    jobs = [{'shard': shard, 'first_id': first_id, 'last_id': last_id, 'source_url': source_url,
+             'source_table': source_table, 'text_column': text_column, 'target_table': target_table,
+             'shard_path': str(shard_dir / f"{target_table}_shard{shard}.sqlite"),
+             'threads': max(1, cores // workers), 'use_cache': use_cache, 'backend': backend, 'dtype': dtype}
+            for shard, (first_id, last_id, _) in enumerate(shard_ranges(source_engine, source_table, workers))]
+    print(f"Classifying {source_table} in {len(jobs)} shards, {max(1, cores // workers)} torch threads each")
+
+    start = time.perf_counter()
+    with context.Pool(len(jobs) or 1) as pool:
+        results = pool.map(_classify_shard, jobs)
+    wall_seconds = time.perf_counter() - start
+
+    merge_shards(target_engine, target_table, [job['shard_path'] for job in jobs])
+    _print_scaling_report(results, len(jobs), wall_seconds, baseline)
+    print(f"Data from {source_table} classified and saved in {target_table}")
+
+
+def main():
+    process_and_classify_sharded('group_processed', 'text', 'group_processed_twice')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+BUILD_TABLE = 'table_builds'
+
+
+def _create_build_table(connection):
+    connection.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {BUILD_TABLE} "
+                               f"(table_name TEXT PRIMARY KEY, built_at TEXT, row_count INTEGER, "
+                               f"source_built_at TEXT)")
+
+
+# Stamp a table that was just (re)built with the time of the build, its row count and, for a table derived from
+# another one, the build stamp of that source. Runs on the connection of the build, so the stamp commits with it.
+def record_build(connection, table_name, source_built_at=None):
+    _create_build_table(connection)
+    row_count = connection.exec_driver_sql(f"SELECT COUNT(*) FROM {table_name}").scalar()
+    built_at = datetime.now().isoformat(timespec='microseconds')
+    connection.execute(text(f"INSERT OR REPLACE INTO {BUILD_TABLE} "
+                            f"(table_name, built_at, row_count, source_built_at) "
+                            f"VALUES (:table_name, :built_at, :row_count, :source_built_at)"),
+                       {'table_name': table_name, 'built_at': built_at, 'row_count': row_count,
+                        'source_built_at': source_built_at})
+    return built_at
+
+
+# Build stamp of a table as a dict (built_at, row_count, source_built_at), or None if it was never stamped
+def get_build(engine, table_name):
+    if not inspect(engine).has_table(BUILD_TABLE):
+        return None
+    with engine.connect() as connection:
+        row = connection.execute(text(f"SELECT built_at, row_count, source_built_at FROM {BUILD_TABLE} "
+                                      f"WHERE table_name = :table_name"), {'table_name': table_name}).fetchone()
+    return dict(row._mapping) if row else None
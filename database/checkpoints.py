@@ -0,0 +1,111 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from database.streaming import BATCH_SIZE, count_rows, iter_batches
+
+CHECKPOINT_TABLE = 'classification_checkpoints'
+
+# Target tables whose key column is already known to be unique in this process
+_unique_tables = set()
+
+
+def _create_checkpoint_table(connection):
+    connection.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} "
+                               f"(source_table TEXT, target_table TEXT, high_water_id INTEGER, updated_at TEXT, "
+                               f"PRIMARY KEY (source_table, target_table))")
+
+
+# Highest source id already written to the target table, or None if the run has never checkpointed
+def get_high_water_mark(engine, source_table, target_table):
+    with engine.begin() as connection:
+        _create_checkpoint_table(connection)
+        row = connection.execute(text(f"SELECT high_water_id FROM {CHECKPOINT_TABLE} "
+                                      f"WHERE source_table = :source AND target_table = :target"),
+                                 {'source': source_table, 'target': target_table}).fetchone()
+    return row[0] if row else None
+
+
+def set_high_water_mark(connection, source_table, target_table, high_water_id):
+    _create_checkpoint_table(connection)
+    connection.execute(text(f"INSERT OR REPLACE INTO {CHECKPOINT_TABLE} "
+                            f"(source_table, target_table, high_water_id, updated_at) "
+                            f"VALUES (:source, :target, :high_water_id, :updated_at)"),
+                       {'source': source_table, 'target': target_table, 'high_water_id': int(high_water_id),
+                        'updated_at': datetime.now().isoformat(timespec='seconds')})
+
+
+# Ids of target rows past the high-water mark that need no rescoring: rows that record the model that scored
+# them. Rows without one were written by the baseline scripts, whose scores could be attached to the wrong arenas,
+# so they are classified again and replaced by the upsert.
+def done_ids(engine, table_name, key='id', after=None, marker='classification_model'):
+    if not inspect(engine).has_table(table_name):
+        return set()
+    columns = {column['name'] for column in inspect(engine).get_columns(table_name)}
+    where = f"WHERE {key} > {int(after)}" if after is not None else ""
+    with engine.connect() as connection:
+        total = connection.exec_driver_sql(f"SELECT COUNT(*) FROM {table_name} {where}").scalar()
+        done = set()
+        if marker in columns:
+            condition = f"{where} AND" if where else "WHERE"
+            done = {row[0] for row in connection.exec_driver_sql(f"SELECT {key} FROM {table_name} "
+                                                                 f"{condition} {marker} IS NOT NULL")}
+    if total > len(done):
+        print(f"{total - len(done):,} rows of {table_name} do not record their classification model and will be "
+              f"rescored")
+    return done
+
+
+# Make the key column unique so that INSERT OR REPLACE overwrites instead of duplicating. Duplicates left
+# behind by earlier append-only runs are dropped first, keeping the first copy of each id.
+def ensure_unique_key(connection, table_name, key='id'):
+    if (str(connection.engine.url), table_name) in _unique_tables:
+        return
+    removed = connection.exec_driver_sql(f"DELETE FROM {table_name} WHERE rowid NOT IN "
+                                         f"(SELECT MIN(rowid) FROM {table_name} GROUP BY {key})").rowcount
+    if removed:
+        print(f"Removed {removed} duplicate rows from {table_name}")
+    connection.exec_driver_sql(f"CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_{key}_unique "
+                               f"ON {table_name} ({key})")
+    _unique_tables.add((str(connection.engine.url), table_name))
+
+
+# pandas to_sql insertion method that upserts on the table's unique key
+def _insert_or_replace(table, connection, keys, data_iter):
+    columns = ', '.join(f'"{key}"' for key in keys)
+    placeholders = ', '.join('?' for _ in keys)
+    connection.exec_driver_sql(f'INSERT OR REPLACE INTO "{table.name}" ({columns}) VALUES ({placeholders})',
+                               list(data_iter))
+
+
+# Upsert one batch and move the high-water mark in the same transaction, so a crash loses at most this batch
+def upsert_batch(batch, engine, source_table, target_table, key='id'):
+    with engine.begin() as connection:
+        batch.head(0).to_sql(target_table, con=connection, if_exists='append', index=False)
+        ensure_unique_key(connection, target_table, key)
+        batch.to_sql(target_table, con=connection, if_exists='append', index=False, method=_insert_or_replace)
+        set_high_water_mark(connection, source_table, target_table, batch[key].max())
+
+
+# Batches of a source table still to be classified into the target table, and their number for progress bars. In
+# resume mode the rows up to the checkpointed high-water mark and the target rows that need no rescoring (see
+# done_ids) are skipped; a batch whose rows are all done comes back empty, so progress still advances.
+def resumable_batches(source_engine, target_engine, source_table, target_table, where=None, columns='*', key='id',
+                      batch_size=BATCH_SIZE, resume=True):
+    high_water_id, done = None, set()
+    if resume:
+        high_water_id = get_high_water_mark(target_engine, source_table, target_table)
+        if high_water_id is not None:
+            print(f"Resuming {source_table} after {key} {high_water_id}")
+        done = done_ids(target_engine, target_table, key, after=high_water_id)
+    total_rows = count_rows(source_engine, source_table, where=where, key=key, after=high_water_id)
+    total_batches = total_rows // batch_size + (total_rows % batch_size != 0)
+    batches = iter_batches(source_engine, source_table, columns=columns, where=where, batch_size=batch_size,
+                           key=key, after=high_water_id)
+    return total_batches, (batch[~batch[key].isin(done)] for batch in batches)
+
+
+# Write a classified batch: upserted together with its checkpoint in resume mode, appended otherwise
+def save_batch(batch, engine, source_table, target_table, resume=True, key='id'):
+    if resume:
+        upsert_batch(batch, engine, source_table, target_table, key)
+    else:
+        batch.to_sql(target_table, con=engine, if_exists='append', index=False)
@@ -1,48 +1,55 @@
-import pandas as pd
 from sqlalchemy import create_engine
+from database.builds import record_build
 
 # Initialize database connections
 engine_processed_classified = create_engine('sqlite:////Users/j_v_samson/Repos/inequality_classifier/processed_classified.sqlite')
-engine_comment_finished = create_engine('sqlite:////Users/j_v_samson/Desktop/comment_finished.sqlite')
+comment_finished_path = '/Users/j_v_samson/Desktop/comment_finished.sqlite'
 
+# Define the columns we need with their types; columns a source table lacks are filled with NULL
+desired_columns = {'id': 'INTEGER', 'typ': 'TEXT', 'detected_language': 'TEXT', 'text': 'TEXT', 'english_text': 'TEXT',
+                   'multi_top_bottom': 'REAL', 'multi_inside_outside': 'REAL', 'multi_us_them': 'REAL',
+                   'multi_today_tomorrow': 'REAL', 'single_top_bottom': 'REAL', 'single_inside_outside': 'REAL',
+                   'single_us_them': 'REAL', 'single_today_tomorrow': 'REAL'}
 
-# Function to process and merge tables
+
+# Select list for one source table: its own column where it has one, NULL otherwise, and the 'typ' label
+def select_list(connection, schema, table_name, typ):
+    existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA {schema}.table_info({table_name})")}
+    return ', '.join(f"'{typ}'" if column == 'typ' else f'"{column}"' if column in existing else 'NULL'
+                     for column in desired_columns)
+
+
+# Function to process and merge tables: the comment database is attached and 'classified_data' is rebuilt with
+# one INSERT ... SELECT per source inside a single transaction, so no rows pass through Python. row_id is an
+# INTEGER PRIMARY KEY, so VACUUM cannot renumber it; every rebuild renumbers it, though, so the build is stamped
+# and tables keyed on row_id (see analysis_scripts/keyword_filter.py) check the stamp before they are used.
 def merge_tables():
-    # Load data from each table
-    df_group = pd.read_sql_table('group_processed_twice', con=engine_processed_classified)
-    df_channel = pd.read_sql_table('channel_classified_twice', con=engine_processed_classified)
-    df_comment = pd.read_sql_table('comment_classified', con=engine_comment_finished)
-
-    # Add 'typ' column
-    df_group['typ'] = 'group'
-    df_channel['typ'] = 'channel'
-    df_comment['typ'] = 'comment'
-
-    # Define the columns we need, ensuring we handle missing columns appropriately
-    desired_columns = ['id', 'typ', 'detected_language', 'text', 'english_text',
-                       'multi_top_bottom', 'multi_inside_outside', 'multi_us_them', 'multi_today_tomorrow',
-                       'single_top_bottom', 'single_inside_outside', 'single_us_them', 'single_today_tomorrow']
-
-    # Create a function to select columns safely
-    def safe_select(df, columns):
-        # Select existing columns and fill missing ones with None
-        existing_columns = df.columns.intersection(columns)
-        missing_columns = [col for col in columns if col not in existing_columns]
-        df = df[existing_columns].copy()
-        for col in missing_columns:
-            df[col] = None
-        return df[columns]  # Return columns in the specified order
-
-    # Apply the safe select function
-    df_group = safe_select(df_group, desired_columns)
-    df_channel = safe_select(df_channel, desired_columns)
-    df_comment = safe_select(df_comment, desired_columns)
-
-    # Merge dataframes
-    df_final = pd.concat([df_group, df_channel, df_comment], ignore_index=True)
-
-    # Save the merged dataframe to a new table in the 'processed_classified' database
-    df_final.to_sql('classified_data', con=engine_processed_classified, if_exists='replace', index=False)
+    # Source tables (schema, table) and the 'typ' each of them is labelled with
+    sources = [('main', 'group_processed_twice', 'group'),
+               ('main', 'channel_classified_twice', 'channel'),
+               ('comment_finished', 'comment_classified', 'comment')]
+
+    with engine_processed_classified.connect() as connection:
+        connection.exec_driver_sql(f"ATTACH DATABASE '{comment_finished_path}' AS comment_finished")
+        connection.commit()
+        try:
+            # Explicit BEGIN, as pysqlite would otherwise commit the DROP and CREATE on their own
+            connection.exec_driver_sql("BEGIN")
+            connection.exec_driver_sql("DROP TABLE IF EXISTS main.classified_data")
+            connection.exec_driver_sql(f"CREATE TABLE main.classified_data "
+                                       f"(row_id INTEGER PRIMARY KEY, "
+                                       f"{', '.join(f'{c} {t}' for c, t in desired_columns.items())})")
+            for schema, table_name, typ in sources:
+                connection.exec_driver_sql(f"INSERT INTO main.classified_data ({', '.join(desired_columns)}) "
+                                           f"SELECT {select_list(connection, schema, table_name, typ)} "
+                                           f"FROM {schema}.{table_name}")
+            record_build(connection, 'classified_data')
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.exec_driver_sql("DETACH DATABASE comment_finished")
 
     print("Tables merged and saved successfully.")
 
@@ -1,14 +1,38 @@
 import os
+import time
 from dotenv import load_dotenv
 import mysql.connector
 import mysql.connector.errors
-from mysql.connector import MySQLConnection
+from mysql.connector import pooling
+from mysql.connector.pooling import MySQLConnectionPool, PooledMySQLConnection
 
+# Connections kept open per process; override with SQL_POOL_SIZE in the environment
+POOL_SIZE = 5
+POOL_NAME = 'inequality_classifier'
+ACQUIRE_POLL_SECONDS = 0.05
+# Longest wait for a free pooled connection; override with SQL_ACQUIRE_TIMEOUT in the environment
+ACQUIRE_TIMEOUT_SECONDS = 30
 
-class DatabaseCredentials:
-    def __init__(self):
+# The pool of this process (a forked child builds its own instead of sharing the parent's sockets)
+_pool = None
+_pool_pid = None
+_env_loaded = False
+
+# Handshake and acquire timings since the last reset
+connection_metrics = {'handshakes': 0, 'handshake_seconds': 0.0, 'acquires': 0, 'acquire_seconds': 0.0}
+
+
+def _load_env():
+    global _env_loaded
+    if not _env_loaded:
         # Load environment variables from .env file
         load_dotenv()
+        _env_loaded = True
+
+
+class DatabaseCredentials:
+    def __init__(self):
+        _load_env()
 
         # Access environment variables
         self.hostname: str = os.environ["SQL_HOSTNAME"]
@@ -16,22 +40,57 @@ class DatabaseCredentials:
         self.database: str = os.environ["SQL_DATABASE"]
         self.username: str = os.environ["SQL_USERNAME"]
         self.password: str = os.environ["SQL_PASSWORD"]
+        self.pool_size: int = int(os.environ.get("SQL_POOL_SIZE", POOL_SIZE))
+        self.acquire_timeout: float = float(os.environ.get("SQL_ACQUIRE_TIMEOUT", ACQUIRE_TIMEOUT_SECONDS))
 
-    def create_database_connection(self) -> MySQLConnection:
-        try:
-            db_connection = mysql.connector.connect(
+    # The process-wide connection pool, created on first use. All connections are opened (and authenticated)
+    # up front; every later acquire reuses one of them.
+    def get_connection_pool(self, pool_size=None) -> MySQLConnectionPool:
+        global _pool, _pool_pid
+        if _pool is None or _pool_pid != os.getpid():
+            size = pool_size or self.pool_size
+            start = time.perf_counter()
+            _pool = pooling.MySQLConnectionPool(
+                pool_name=POOL_NAME,
+                pool_size=size,
                 host=self.hostname,
                 port=self.port,
                 database=self.database,
                 user=self.username,
                 password=self.password
             )
+            _pool_pid = os.getpid()
+            connection_metrics['handshakes'] += size
+            connection_metrics['handshake_seconds'] += time.perf_counter() - start
+        return _pool
+
+    # Borrow a connection from the pool, waiting while all of them are in use. close() returns it to the pool.
+    # Raises PoolError when no connection frees up within the acquire timeout (a leaked connection would otherwise
+    # hang the caller forever); connection errors propagate to the caller.
+    def create_database_connection(self) -> PooledMySQLConnection:
+        pool = self.get_connection_pool()
+        start = time.perf_counter()
+        while True:
+            try:
+                db_connection = pool.get_connection()
+                break
+            except mysql.connector.errors.PoolError:
+                if time.perf_counter() - start >= self.acquire_timeout:
+                    raise mysql.connector.errors.PoolError(
+                        f"No free connection in pool {POOL_NAME} after {self.acquire_timeout:g} seconds")
+                time.sleep(ACQUIRE_POLL_SECONDS)
+        connection_metrics['acquires'] += 1
+        connection_metrics['acquire_seconds'] += time.perf_counter() - start
+        return db_connection
+
 
-            if db_connection.is_connected():
-                print("Database connection works!")
-                db_connection.close()
+def connection_summary():
+    handshakes, acquires = connection_metrics['handshakes'], connection_metrics['acquires']
+    handshake_ms = 1000 * connection_metrics['handshake_seconds'] / handshakes if handshakes else 0.0
+    acquire_ms = 1000 * connection_metrics['acquire_seconds'] / acquires if acquires else 0.0
+    return f"MySQL: {handshakes:,} handshakes ({handshake_ms:.1f} ms each), {acquires:,} acquires " \
+           f"({acquire_ms:.2f} ms each)"
 
-            return db_connection
 
-        except mysql.connector.Error as error:
-            print(f'{error}')
+def reset_connection_metrics():
+    connection_metrics.update({'handshakes': 0, 'handshake_seconds': 0.0, 'acquires': 0, 'acquire_seconds': 0.0})
@@ -1,33 +1,31 @@
 from database.credentials import DatabaseCredentials
+from database.mysql_streaming import iter_table
 import pandas as pd
 import mysql.connector
 
 
-def fetch_table_data(table_name, row_limit=None):
+# Fetch a table, or a seeded random sample of row_limit rows, streamed from the server in bounded chunks
+def fetch_table_data(table_name, row_limit=None, seed=0):
     creds = DatabaseCredentials()
     connection = creds.create_database_connection()
 
-    limit_clause = f"LIMIT {row_limit}" if row_limit is not None else ""
-    query = f"SELECT *, '{table_name}' as source_table FROM {table_name} ORDER BY RAND() {limit_clause};"
+    columns = f"*, '{table_name}' as source_table"
 
     try:
-        connection.connect()
-        with connection.cursor(dictionary=True) as cursor:
-            cursor.execute(query)
-            rows = cursor.fetchall()
-        return pd.DataFrame(rows)
+        chunks = list(iter_table(connection, table_name, columns, row_limit, seed))
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
     except mysql.connector.Error as e:
         print(f"Error fetching data: {e}")
         return pd.DataFrame()
     finally:
-        if connection.is_connected():
-            connection.close()
+        # Return the connection to the pool
+        connection.close()
 
 
-def get_combined_data(row_limit=10):
-    channel_data = fetch_table_data('channel_results', row_limit)
-    comment_data = fetch_table_data('comment_results', row_limit)
-    group_data = fetch_table_data('group_results', row_limit)
+def get_combined_data(row_limit=10, seed=0):
+    channel_data = fetch_table_data('channel_results', row_limit, seed)
+    comment_data = fetch_table_data('comment_results', row_limit, seed)
+    group_data = fetch_table_data('group_results', row_limit, seed)
 
     combined_data = pd.concat([channel_data, comment_data, group_data], ignore_index=True)
     return combined_data, channel_data, comment_data, group_data
@@ -1,41 +1,71 @@
 import sqlite3
-import pandas as pd
 import mysql.connector
 from datetime import datetime
-from database.credentials import DatabaseCredentials
+from sqlalchemy import create_engine
+from database.checkpoints import get_high_water_mark, upsert_batch
+from database.credentials import DatabaseCredentials, connection_summary
+from database.mysql_streaming import FETCH_CHUNK, iter_table, stream_query
 
 
-def fetch_table_data(table_name, sqlite_db_path, row_limit=None):
+# Copy a table, or a seeded random sample of row_limit rows, into a new timestamped SQLite table. Rows are
+# streamed from the server and written chunk by chunk, so memory stays bounded whatever the table size.
+def fetch_table_data(table_name, sqlite_db_path, row_limit=None, seed=0):
     creds = DatabaseCredentials()
     connection = creds.create_database_connection()
-    limit_clause = f"LIMIT {row_limit}" if row_limit else ""
-    query = f"SELECT * FROM {table_name} {limit_clause};"
 
     try:
-        connection.connect()
-        with connection.cursor(dictionary=True) as cursor:
-            cursor.execute(query)
-            rows = cursor.fetchall()
-        data = pd.DataFrame(rows)
-
-        # Saving directly to SQLite database
         timestamp = datetime.now().strftime('%Y%m%d_%H%M')
         table_name_with_timestamp = f"{table_name}_{timestamp}"
+
+        # Saving directly to SQLite database
         with sqlite3.connect(sqlite_db_path) as conn:
-            data.to_sql(name=table_name_with_timestamp, con=conn, if_exists='replace', index=False)
+            if_exists = 'replace'
+            for chunk in iter_table(connection, table_name, row_limit=row_limit, seed=seed):
+                chunk.to_sql(name=table_name_with_timestamp, con=conn, if_exists=if_exists, index=False)
+                if_exists = 'append'
             print(f"Data from {table_name} inserted into SQLite table {table_name_with_timestamp}")
     except mysql.connector.Error as e:
         print(f"Error fetching data from MySQL: {e}")
     finally:
-        if connection.is_connected():
-            connection.close()
+        # Return the connection to the pool
+        connection.close()
+
+
+# Incremental sync into one canonical local table per source, named like the source table. Only rows above the
+# table's high-water mark (the largest id synced so far) are pulled, streamed in id order and upserted batch by
+# batch together with the new mark, so an interrupted sync resumes where it stopped. Rows edited on the server
+# after they were synced are not picked up again.
+def sync_table(table_name, sqlite_db_path, chunk_size=FETCH_CHUNK):
+    engine = create_engine(f"sqlite:///{sqlite_db_path}")
+    source = f"mysql.{table_name}"
+    high_water_id = get_high_water_mark(engine, source, table_name)
+    where = f"WHERE id > {int(high_water_id)}" if high_water_id is not None else ""
+
+    creds = DatabaseCredentials()
+    connection = creds.create_database_connection()
+    rows = 0
+    try:
+        for chunk in stream_query(connection, f"SELECT * FROM {table_name} {where} ORDER BY id", chunk_size):
+            upsert_batch(chunk, engine, source, table_name)
+            rows += len(chunk)
+        print(f"Synced {rows:,} new rows from {table_name} into SQLite table {table_name}")
+    except mysql.connector.Error as e:
+        print(f"Error fetching data from MySQL: {e}")
+    finally:
+        # Return the connection to the pool
+        connection.close()
+    return rows
 
 
-def main():
+def main(incremental=True):
     sqlite_db_path = '/Users/j_v_samson/Repos/inequality_classifier/inequality_data.sqlite'
     tables = ['channel_results', 'comment_results', 'group_results']
     for table in tables:
-        fetch_table_data(table, sqlite_db_path, row_limit=None)  # Adjust row_limit as needed
+        if incremental:
+            sync_table(table, sqlite_db_path)
+        else:
+            fetch_table_data(table, sqlite_db_path, row_limit=None)  # Adjust row_limit as needed
+    print(connection_summary())
 
 
 if __name__ == "__main__":
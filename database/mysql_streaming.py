@@ -0,0 +1,68 @@
+import math
+import pandas as pd
+
+# Rows fetched from the server per round trip
+FETCH_CHUNK = 5000
+
+# Random samples: rows are kept by a seeded hash of their id. The hash filter lets a little more than the requested
+# share through (estimates from information_schema are approximate) and the rows with the smallest hashes are kept.
+HASH_BUCKETS = 1_000_000
+SAMPLE_OVERSAMPLING = 1.5
+
+
+# Row count estimate from information_schema, which costs nothing compared to COUNT(*) on a large InnoDB table
+def estimated_rows(connection, table_name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table_name,))
+        row = cursor.fetchone()
+    return int(row[0] or 0) if row else 0
+
+
+# Stream the result of a query through an unbuffered cursor in DataFrame chunks, so neither the server nor the
+# client has to hold the whole result at once
+def stream_query(connection, query, chunk_size=FETCH_CHUNK):
+    with connection.cursor(dictionary=True, buffered=False) as cursor:
+        cursor.execute(query)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield pd.DataFrame(rows)
+        finally:
+            if connection.unread_result:
+                connection.consume_results()
+
+
+def _sample_hash(seed):
+    return f"MOD(CRC32(CONCAT(id, ':', {int(seed)})), {HASH_BUCKETS})"
+
+
+# Seeded random sample of row_limit rows without ORDER BY RAND(): the server only evaluates a hash filter while
+# scanning, and the few surplus rows are dropped client-side by smallest hash. The same seed gives the same sample.
+def sample_table(connection, table_name, row_limit, seed=0, columns='*', chunk_size=FETCH_CHUNK):
+    total = estimated_rows(connection, table_name)
+    fraction = min(1.0, SAMPLE_OVERSAMPLING * row_limit / total) if total else 1.0
+    while True:
+        threshold = math.ceil(fraction * HASH_BUCKETS)
+        query = f"SELECT {columns}, {_sample_hash(seed)} AS _sample_hash FROM {table_name} " \
+                f"WHERE {_sample_hash(seed)} < {threshold}"
+        chunks = list(stream_query(connection, query, chunk_size))
+        sample = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=['_sample_hash'])
+        # The estimate was too low: widen the filter, which only adds rows to the previous candidates
+        if len(sample) >= row_limit or fraction >= 1.0:
+            break
+        fraction = min(1.0, fraction * 2)
+    return sample.nsmallest(row_limit, '_sample_hash').drop(columns=['_sample_hash']).reset_index(drop=True)
+
+
+# Yield a MySQL table in bounded DataFrame chunks: the whole table streamed, or a seeded random sample of
+# row_limit rows
+def iter_table(connection, table_name, columns='*', row_limit=None, seed=0, chunk_size=FETCH_CHUNK):
+    if row_limit is None:
+        yield from stream_query(connection, f"SELECT {columns} FROM {table_name}", chunk_size)
+        return
+    sample = sample_table(connection, table_name, row_limit, seed, columns, chunk_size)
+    for start in range(0, len(sample), chunk_size):
+        yield sample.iloc[start:start + chunk_size].reset_index(drop=True)
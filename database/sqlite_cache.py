@@ -0,0 +1,103 @@
+import hashlib
+import json
+import sqlite3
+import time
+import unicodedata
+
+# SQLite limits the number of bound variables per statement, so lookups are chunked
+LOOKUP_CHUNK = 500
+
+
+# Normalize a text before hashing so that reposts differing only in whitespace or unicode form share an entry
+def normalize_text(text):
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+# Persistent key/value store on disk with size-bounded LRU eviction and hit/miss counters. Values are stored as
+# JSON; every entry belongs to a namespace so a whole group of entries can be invalidated at once.
+class SQLiteCache:
+    def __init__(self, db_path, table_name='cache', max_entries=1_000_000):
+        self.table_name = table_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table_name} "
+                                f"(key TEXT PRIMARY KEY, namespace TEXT, value TEXT, last_used REAL)")
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_last_used ON {table_name} (last_used)")
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_namespace ON {table_name} (namespace)")
+        self.connection.commit()
+        # Running estimate of the number of entries, so put_many only counts the table once it may be over the
+        # limit. Entries written by other processes sharing the file are picked up whenever evict recounts.
+        self.size = self._count()
+
+    # Look up many keys at once; returns a dict with the decoded values of the keys that were found
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = self.connection.execute(
+                f"SELECT key, value FROM {self.table_name} WHERE key IN ({placeholders})", chunk).fetchall()
+            found.update((key, json.loads(value)) for key, value in rows)
+
+        now = time.time()
+        self.connection.executemany(f"UPDATE {self.table_name} SET last_used = ? WHERE key = ?",
+                                    [(now, key) for key in found])
+        self.connection.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    # Store many values under one namespace, then evict the least recently used entries beyond max_entries
+    def put_many(self, items, namespace=''):
+        now = time.time()
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO {self.table_name} (key, namespace, value, last_used) VALUES (?, ?, ?, ?)",
+            [(key, namespace, json.dumps(value), now) for key, value in items.items()])
+        self.size += len(items)  # replaced keys do not grow the table, so this errs towards recounting early
+        if self.size > self.max_entries:
+            self.evict()
+        self.connection.commit()
+
+    def put(self, key, value, namespace=''):
+        self.put_many({key: value}, namespace)
+
+    def _count(self):
+        return self.connection.execute(f"SELECT COUNT(*) FROM {self.table_name}").fetchone()[0]
+
+    # Count the entries (other processes may share the file) and drop the least recently used beyond max_entries
+    def evict(self):
+        self.size = self._count()
+        if self.size > self.max_entries:
+            self.connection.execute(
+                f"DELETE FROM {self.table_name} WHERE key IN "
+                f"(SELECT key FROM {self.table_name} ORDER BY last_used LIMIT ?)", (self.size - self.max_entries,))
+            self.size = self.max_entries
+
+    # Drop every entry of one namespace, leaving all other namespaces untouched
+    def invalidate(self, namespace):
+        self.size -= self.connection.execute(f"DELETE FROM {self.table_name} WHERE namespace = ?",
+                                             (namespace,)).rowcount
+        self.connection.commit()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return f"{self.hits:,} hits, {self.misses:,} misses ({self.hit_rate():.1%} hit rate)"
+
+    def close(self):
+        self.connection.close()
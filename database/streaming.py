@@ -0,0 +1,43 @@
+import pandas as pd
+from sqlalchemy import text
+
+BATCH_SIZE = 500
+
+
+def _where_clause(where, key, last_key):
+    conditions = [f"({where})"] if where else []
+    if last_key is not None:
+        conditions.append(f"{key} > :last_key")
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+# Index the key column of a table that is streamed by that key
+def ensure_index(engine, table_name, key):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {table_name}_{key}_idx ON {table_name} ({key})")
+
+
+# Number of rows a streamed read with the same arguments will return, for progress bars
+def count_rows(engine, table_name, where=None, key='rowid', after=None):
+    with engine.connect() as connection:
+        return connection.execute(text(f"SELECT COUNT(*) FROM {table_name} {_where_clause(where, key, after)}"),
+                                  {'last_key': after}).scalar()
+
+
+# Yield a SQLite table in bounded DataFrame batches. Pages are fetched by keyset (key > last key seen, ordered by
+# key) rather than OFFSET or a whole-table read, so every page costs the same and memory stays flat. The key is
+# the rowid by default; any other key column needs an index for the pages to be found without scanning, which
+# the script that streams the table creates once with ensure_index (reading never writes to the database).
+def iter_batches(engine, table_name, columns='*', where=None, batch_size=BATCH_SIZE, key='rowid', after=None):
+    last_key = after
+    while True:
+        query = f"SELECT {key} AS _stream_key, {columns} FROM {table_name} {_where_clause(where, key, last_key)} " \
+                f"ORDER BY {key} LIMIT {batch_size}"
+        batch = pd.read_sql(text(query), engine, params={'last_key': last_key})
+        if batch.empty:
+            return
+
+        last_key = batch['_stream_key'].iloc[-1].item()
+        yield batch.drop(columns=['_stream_key'])
+        if len(batch) < batch_size:
+            return
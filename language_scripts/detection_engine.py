@@ -0,0 +1,44 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import langdetect
+from tqdm import tqdm
+
+# Texts handed to a worker process at a time; large enough to amortize the inter-process round trip
+CHUNK_SIZE = 256
+
+
+# langdetect samples randomly; a fixed seed in every worker makes detection reproducible across runs
+def seed_detector():
+    langdetect.DetectorFactory.seed = 0
+
+
+# Most likely language of a text and its probability; empty texts and failed detections are 'unknown'
+def detect_language_with_confidence(text):
+    if text is None or not text.strip():
+        return 'unknown', 0.0
+    try:
+        best = langdetect.detect_langs(text.strip())[0]
+        return best.lang, best.prob
+    except langdetect.lang_detect_exception.LangDetectException:
+        return 'unknown', 0.0
+
+
+def detect_language(text):
+    return detect_language_with_confidence(text)[0]
+
+
+# Process pool for language detection, one worker per core by default. Reuse it across batches so the language
+# profiles are loaded once per worker rather than once per batch.
+def language_pool(workers=None):
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=seed_detector)
+
+
+# Detect the language of every text on a process pool, in input order. Without a pool a temporary one is used.
+def detect_languages(texts, pool=None, chunk_size=CHUNK_SIZE, desc=None):
+    if pool is None:
+        with language_pool() as pool:
+            return detect_languages(texts, pool, chunk_size, desc)
+    results = pool.map(detect_language, texts, chunksize=chunk_size)
+    if desc:
+        results = tqdm(results, total=len(texts), desc=desc)
+    return list(results)
@@ -1,22 +1,13 @@
 import sys
+from datetime import datetime
 
 from database.fetch_data import get_combined_data
-import langdetect
-from tqdm import tqdm
+from language_scripts.detection_engine import detect_languages
 
 
+# Detect the language of every text on a process pool; empty texts and failed detections become 'unknown'
 def detect_language(texts):
-    language_detection_results = []
-    for text in tqdm(texts, desc="Detecting Languages"):
-        try:
-            if text is None or not text.strip():
-                language_detection_results.append('unknown')
-                continue
-            detected_lang = langdetect.detect(text)
-            language_detection_results.append(detected_lang)
-        except langdetect.lang_detect_exception.LangDetectException:
-            language_detection_results.append('unknown')
-    return language_detection_results
+    return detect_languages(texts, desc="Detecting Languages")
 
 
 def process_and_save_data_with_language(data, data_type):
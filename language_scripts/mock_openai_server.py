@@ -0,0 +1,88 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from language_scripts.openai_engine import translate_texts, translate_texts_packed, request_summary, \
+    packing_summary, reset_request_stats
+
+
+# OpenAI-compatible /v1/chat/completions endpoint for offline load tests. Every request waits a fixed latency and a
+# share of them fail with 429 or 500, so concurrency, rate limiting and retries can be exercised without an API key.
+# Packed (JSON mode) requests get a JSON object back, with a share of the items dropped to exercise the fallback.
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+
+        if random.random() < self.server.failure_rate:
+            status = random.choice([429, 500])
+            self._send(status, {'error': {'message': 'Mock failure', 'type': 'mock_error', 'code': status}})
+            return
+
+        if body.get('response_format', {}).get('type') == 'json_object':
+            numbered = json.loads(body['messages'][-1]['content'])
+            content = json.dumps({number: f"[en] {text}" for number, text in numbered.items()
+                                  if random.random() >= self.server.drop_rate})
+        else:
+            content = f"[en] {body['messages'][-1]['content']}"
+        prompt_tokens = sum(len(message['content']) // 4 + 1 for message in body['messages'])
+        self._send(200, {
+            'id': f"chatcmpl-mock{self.server.requests}", 'object': 'chat.completion', 'created': int(time.time()),
+            'model': body['model'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content) // 4 + 1,
+                      'total_tokens': prompt_tokens + len(content) // 4 + 1}})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Start the mock server on a background thread; port 0 picks a free port. Returns the server and its base URL.
+def start_mock_server(port=0, latency=0.2, failure_rate=0.1, drop_rate=0.02):
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockOpenAIHandler)
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.drop_rate = drop_rate
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+# Load test: translate synthetic posts against the mock server at several concurrency limits
+def main(n_texts=200, latency=0.2, failure_rate=0.1):
+    server, base_url = start_mock_server(latency=latency, failure_rate=failure_rate)
+    texts = [f"Nachricht Nummer {i}" for i in range(n_texts)]
+    try:
+        for concurrency in [1, 8, 32]:
+            reset_request_stats()
+            start = time.perf_counter()
+            results = translate_texts(texts, concurrency=concurrency, base_url=base_url, api_key='mock')
+            seconds = time.perf_counter() - start
+            in_order = all(result == f"[en] {text}" for result, text in zip(results, texts))
+            print(f"Concurrency {concurrency}: {n_texts / seconds:.1f} texts/sec, results in order: {in_order}")
+            print(request_summary())
+
+        reset_request_stats()
+        start = time.perf_counter()
+        results = translate_texts_packed(texts, concurrency=8, base_url=base_url, api_key='mock')
+        seconds = time.perf_counter() - start
+        in_order = all(result == f"[en] {text}" for result, text in zip(results, texts))
+        print(f"Packed, concurrency 8: {n_texts / seconds:.1f} texts/sec, results in order: {in_order}")
+        print(request_summary())
+        print(packing_summary())
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
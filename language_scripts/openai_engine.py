@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import random
+import time
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
+
+MODEL_NAME = "gpt-3.5-turbo"
+SYSTEM_PROMPT = "You will be provided with a Text in an unkonwn language, and your task is to " \
+                "translate it into English."
+
+PACKED_SYSTEM_PROMPT = "You will be provided with a JSON object of numbered texts in unknown languages. Translate " \
+                       "each text into English and answer with a JSON object that maps every number to its " \
+                       "translation, without any other text."
+
+# Defaults for concurrent requests: in-flight request limit, account rate limits and retry budget
+CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 60_000
+MAX_TOKENS = 64
+MAX_RETRIES = 6
+MAX_BACKOFF = 60
+
+# Packing mode: texts of at most SHORT_TEXT_TOKENS are sent PACK_MAX_ITEMS at a time in one request
+SHORT_TEXT_TOKENS = 50
+PACK_MAX_ITEMS = 20
+
+# Request counters since the last reset
+request_stats = {'requests': 0, 'retries': 0, 'failures': 0, 'seconds': 0.0}
+packing_stats = {'packed_requests': 0, 'packed_items': 0, 'fallbacks': 0, 'requests_saved': 0,
+                 'prompt_tokens_saved': 0}
+
+
+# Rough token count (about four characters per token), used to budget requests against the tokens/min limit
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+# Token bucket refilled continuously at capacity per minute. Waiters are served one at a time, in arrival order.
+# The bucket outlives a single event loop (every complete_chats call runs its own), so its lock is made per loop.
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.available = per_minute
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+        self.lock = None
+        self.loop = None
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.lock, self.loop = asyncio.Lock(), loop
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+
+# Requests/min and tokens/min limits together: a request goes out once both buckets can pay for it
+class RateLimiter:
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+
+# One limiter per (requests/min, tokens/min) pair and process, so consecutive calls (such as the chunks of a long
+# translation run) share one budget instead of each starting with a full minute's allowance
+_limiters = {}
+
+
+def shared_limiter(requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+    key = (requests_per_minute, tokens_per_minute)
+    if key not in _limiters:
+        _limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+    return _limiters[key]
+
+
+def _retryable(error):
+    return isinstance(error, APIConnectionError) or error.status_code == 429 or error.status_code >= 500
+
+
+# One chat completion under the concurrency and rate limits. Rate-limit, server and connection errors are retried
+# with full-jitter exponential backoff; the concurrency slot is released while backing off.
+async def _complete(client, limiter, semaphore, messages, model_name, max_tokens, max_retries, request_options):
+    cost = sum(estimate_tokens(message['content']) for message in messages) + max_tokens
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(cost)
+        try:
+            async with semaphore:
+                response = await client.chat.completions.create(model=model_name, messages=messages,
+                                                                temperature=0.5, max_tokens=max_tokens, top_p=1,
+                                                                **request_options)
+            request_stats['requests'] += 1
+            return response.choices[0].message.content.strip()
+        except (APIConnectionError, APIStatusError) as e:
+            if not _retryable(e) or attempt == max_retries:
+                request_stats['failures'] += 1
+                raise
+            request_stats['retries'] += 1
+            await asyncio.sleep(random.uniform(0, min(MAX_BACKOFF, 2 ** attempt)))
+
+
+async def _complete_all(conversations, model_name, concurrency, requests_per_minute, tokens_per_minute, max_tokens,
+                        max_retries, base_url, api_key, request_options):
+    client = AsyncOpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"), base_url=base_url, max_retries=0)
+    limiter = shared_limiter(requests_per_minute, tokens_per_minute)
+    semaphore = asyncio.Semaphore(concurrency)
+    try:
+        return await asyncio.gather(*(_complete(client, limiter, semaphore, messages, model_name, max_tokens,
+                                                max_retries, request_options) for messages in conversations),
+                                    return_exceptions=True)
+    finally:
+        await client.close()
+
+
+# Run many chat conversations concurrently and return the responses in input order. A conversation that still
+# fails after its retries yields the exception instead of a string, so one bad item does not sink the batch.
+def complete_chats(conversations, model_name=MODEL_NAME, concurrency=CONCURRENCY,
+                   requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                   max_tokens=MAX_TOKENS, max_retries=MAX_RETRIES, base_url=None, api_key=None, **request_options):
+    start = time.perf_counter()
+    results = asyncio.run(_complete_all(conversations, model_name, concurrency, requests_per_minute,
+                                        tokens_per_minute, max_tokens, max_retries, base_url, api_key,
+                                        request_options))
+    request_stats['seconds'] += time.perf_counter() - start
+    return results
+
+
+def translation_messages(text):
+    return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": text}]
+
+
+def translate_texts(texts, **options):
+    return complete_chats([translation_messages(text) for text in texts], **options)
+
+
+# Group the positions of short texts into packs of at most max_items, in input order
+def pack_texts(texts, short_text_tokens=SHORT_TEXT_TOKENS, max_items=PACK_MAX_ITEMS):
+    short = [i for i, text in enumerate(texts) if estimate_tokens(text) <= short_text_tokens]
+    return [short[start:start + max_items] for start in range(0, len(short), max_items)]
+
+
+def packed_messages(texts):
+    numbered = json.dumps({str(number): text for number, text in enumerate(texts, start=1)}, ensure_ascii=False)
+    return [{"role": "system", "content": PACKED_SYSTEM_PROMPT}, {"role": "user", "content": numbered}]
+
+
+# Unpack a packed response into one translation per text. Items that are missing, empty or not strings come
+# back as None; a response that is not a JSON object or has numbers that were never sent fails as a whole.
+def unpack_response(response, n_texts):
+    content = response.strip().removeprefix('```json').removeprefix('```').removesuffix('```').strip()
+    try:
+        translations = json.loads(content)
+    except json.JSONDecodeError:
+        return [None] * n_texts
+    if not isinstance(translations, dict) or not set(translations) <= {str(n) for n in range(1, n_texts + 1)}:
+        return [None] * n_texts
+    return [translation.strip() if isinstance(translation, str) and translation.strip() else None
+            for translation in (translations.get(str(number)) for number in range(1, n_texts + 1))]
+
+
+# Translate texts with short ones packed into shared requests. Long texts and every packed item that fails
+# validation are translated one by one. Requests and prompt tokens saved against one request per text are counted.
+def translate_texts_packed(texts, short_text_tokens=SHORT_TEXT_TOKENS, max_items=PACK_MAX_ITEMS, **options):
+    packs = pack_texts(texts, short_text_tokens, max_items)
+    max_tokens = options.pop('max_tokens', MAX_TOKENS)
+    responses = complete_chats([packed_messages([texts[i] for i in pack]) for pack in packs],
+                               max_tokens=max_tokens * max_items, response_format={"type": "json_object"},
+                               **options) if packs else []
+
+    results = [None] * len(texts)
+    for pack, response in zip(packs, responses):
+        unpacked = [None] * len(pack) if isinstance(response, Exception) else unpack_response(response, len(pack))
+        for i, translation in zip(pack, unpacked):
+            results[i] = translation
+    fallback = [i for i, result in enumerate(results) if result is None]
+    if fallback:
+        for i, translation in zip(fallback, translate_texts([texts[i] for i in fallback], max_tokens=max_tokens,
+                                                            **options)):
+            results[i] = translation
+
+    packed = {i for pack in packs for i in pack}
+    single_prompt_tokens = sum(estimate_tokens(message['content']) for i in packed
+                               for message in translation_messages(texts[i]))
+    packed_prompt_tokens = sum(estimate_tokens(message['content']) for pack in packs
+                               for message in packed_messages([texts[i] for i in pack]))
+    fallback_prompt_tokens = sum(estimate_tokens(message['content']) for i in fallback if i in packed
+                                 for message in translation_messages(texts[i]))
+    packing_stats['packed_requests'] += len(packs)
+    packing_stats['packed_items'] += len(packed)
+    packing_stats['fallbacks'] += sum(i in packed for i in fallback)
+    packing_stats['requests_saved'] += len(packed) - len(packs) - sum(i in packed for i in fallback)
+    packing_stats['prompt_tokens_saved'] += single_prompt_tokens - packed_prompt_tokens - fallback_prompt_tokens
+    return results
+
+
+def packing_summary():
+    return f"Packing: {packing_stats['packed_items']:,} texts in {packing_stats['packed_requests']:,} requests, " \
+           f"{packing_stats['fallbacks']:,} single-item fallbacks, {packing_stats['requests_saved']:,} requests " \
+           f"and ~{packing_stats['prompt_tokens_saved']:,} prompt tokens saved"
+
+
+def request_summary():
+    rate = request_stats['requests'] / request_stats['seconds'] if request_stats['seconds'] else 0.0
+    return f"OpenAI: {request_stats['requests']:,} requests ({rate:.1f}/sec), {request_stats['retries']:,} retries, " \
+           f"{request_stats['failures']:,} failures"
+
+
+def reset_request_stats():
+    request_stats.update({'requests': 0, 'retries': 0, 'failures': 0, 'seconds': 0.0})
+    packing_stats.update({'packed_requests': 0, 'packed_items': 0, 'fallbacks': 0, 'requests_saved': 0,
+                          'prompt_tokens_saved': 0})
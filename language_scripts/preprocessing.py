@@ -0,0 +1,95 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+from transformers import AutoTokenizer
+from classification_scripts.classifier_engine import DEFAULT_MODEL
+from database.sqlite_cache import normalize_text
+from language_scripts.detection_engine import CHUNK_SIZE, detect_language_with_confidence, seed_detector
+
+# Rows preprocessed and written back per transaction
+BATCH_SIZE = 5000
+
+# Fields computed once per post by the preprocessing stage and read by every later stage
+PREPROCESSED_COLUMNS = {'normalized_text': 'TEXT', 'detected_language': 'TEXT', 'language_confidence': 'REAL',
+                        'token_length': 'INTEGER'}
+
+# Tokenizer of the worker process, loaded once by the pool initializer
+_tokenizer = None
+
+
+def _init_worker(model_name):
+    global _tokenizer
+    seed_detector()
+    _tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+
+# Normalized text, detected language, language confidence and token length (in classifier tokens) of each text
+def preprocess_chunk(texts):
+    normalized = [normalize_text(text) if text else '' for text in texts]
+    lengths = [len(ids) for ids in _tokenizer(normalized, add_special_tokens=False)['input_ids']]
+    return [(text, *detect_language_with_confidence(text), length) for text, length in zip(normalized, lengths)]
+
+
+def preprocessing_pool(workers=None, model_name=DEFAULT_MODEL):
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                               initargs=(model_name,))
+
+
+def preprocess_texts(texts, pool, chunk_size=CHUNK_SIZE):
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    return [row for rows in pool.map(preprocess_chunk, chunks) for row in rows]
+
+
+def add_preprocessed_columns(cursor, table_name):
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    columns = [info[1] for info in cursor.fetchall()]
+    for column, column_type in PREPROCESSED_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {column_type}")
+
+
+# Preprocessing stage: compute the preprocessed fields of every row that has none yet and store them next to the
+# text, so translation and classification read them instead of detecting or tokenizing again. Rows are paged by
+# rowid, processed on a process pool and written back with executemany, one bounded transaction per page.
+def preprocess_table(db_path, table_name, text_column='text', batch_size=BATCH_SIZE, workers=None):
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    cursor = conn.cursor()
+    add_preprocessed_columns(cursor, table_name)
+    conn.commit()
+
+    total = cursor.execute(f"SELECT COUNT(*) FROM {table_name} WHERE normalized_text IS NULL").fetchone()[0]
+    pbar = tqdm(total=total, desc=f"Preprocessing {table_name}")
+    last_rowid = 0
+    with preprocessing_pool(workers) as pool:
+        while True:
+            rows = cursor.execute(f"SELECT rowid, {text_column} FROM {table_name} WHERE normalized_text IS NULL "
+                                  f"AND rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+
+            results = preprocess_texts([text for _, text in rows], pool)
+            with conn:
+                conn.executemany(f"UPDATE {table_name} SET normalized_text = ?, detected_language = ?, "
+                                 f"language_confidence = ?, token_length = ? WHERE rowid = ?",
+                                 [(*result, rowid) for result, (rowid, _) in zip(results, rows)])
+            last_rowid = rows[-1][0]
+            pbar.update(len(rows))
+
+    pbar.close()
+    conn.close()
+    print(f"Preprocessing completed for table {table_name}")
+
+
+def main():
+    db_path = '/Users/j_v_samson/Repos/inequality_classifier/inequality_data.sqlite'
+    # Canonical tables kept up to date by fetch_to_local_db.sync_table; only newly synced rows are processed
+    table_names = ['channel_results', 'comment_results', 'group_results']
+
+    for table in table_names:
+        preprocess_table(db_path, table)
+
+
+if __name__ == "__main__":
+    main()
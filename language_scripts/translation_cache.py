@@ -0,0 +1,32 @@
+from database.sqlite_cache import SQLiteCache, text_hash
+
+CACHE_PATH = '/Users/j_v_samson/Repos/inequality_classifier/translation_cache.sqlite'
+
+# One cache per process, shared by every translator backend
+_shared_cache = None
+
+
+# Translations keyed by (normalized source text hash, source language, backend, model name). The backend and
+# model double as namespace, so the translations of one model can be dropped without touching the others.
+class TranslationCache(SQLiteCache):
+    def __init__(self, db_path=CACHE_PATH, max_entries=1_000_000):
+        super().__init__(db_path, table_name='translation_cache', max_entries=max_entries)
+        self.saved_calls = 0
+
+    @staticmethod
+    def key(text, source_language, backend, model_name):
+        return f"{text_hash(text)}|{source_language}|{backend}|{model_name}"
+
+    @staticmethod
+    def namespace(backend, model_name):
+        return f"{backend}|{model_name}"
+
+    def stats(self):
+        return f"{super().stats()}, {self.saved_calls:,} translation calls saved"
+
+
+def get_translation_cache():
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = TranslationCache()
+    return _shared_cache
@@ -0,0 +1,96 @@
+import time
+import torch
+from language_scripts.detection_engine import detect_language
+
+# Generation settings shared by the seq2seq translators. Batches are padded to their longest text only.
+BATCH_SIZE = 16
+NUM_BEAMS = 5
+MAX_NEW_TOKENS = 256
+MAX_SOURCE_TOKENS = 512
+
+
+# Sort the texts that need translating into one group of positions per source language. Empty and English texts
+# are resolved right away. Languages stored by the preprocessing stage should be passed in; only texts without
+# one are detected here.
+def group_by_language(texts, languages=None):
+    translations = [None] * len(texts)
+    groups = {}
+    for i, text in enumerate(texts):
+        if not text.strip():
+            translations[i] = ('', 'unknown')
+            continue
+        language = languages[i] if languages is not None and isinstance(languages[i], str) and languages[i] \
+            else detect_language(text)
+        if language == 'en':
+            translations[i] = (text, 'en')
+            continue
+        groups.setdefault(language, []).append(i)
+    return translations, groups
+
+
+# Translate the texts of one source language in length-sorted batches. The tokenizer's src_lang must already be
+# set; generation is forced to start with the English language token. Returns the translations in input order
+# and the number of source tokens translated.
+def translate_batches(model, tokenizer, device, texts, forced_bos_token_id, batch_size=BATCH_SIZE,
+                      num_beams=NUM_BEAMS, max_new_tokens=MAX_NEW_TOKENS, max_length=MAX_SOURCE_TOKENS):
+    lengths = [len(ids) for ids in tokenizer(texts, truncation=True, max_length=max_length)['input_ids']]
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
+    translations = [''] * len(texts)
+    tokens = 0
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        encoded = tokenizer([texts[i] for i in batch], return_tensors="pt", padding=True, truncation=True,
+                            max_length=max_length).to(device)
+        with torch.inference_mode():
+            generated_tokens = model.generate(**encoded, forced_bos_token_id=forced_bos_token_id,
+                                              num_beams=num_beams, max_new_tokens=max_new_tokens)
+        for i, translation in zip(batch, tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)):
+            translations[i] = translation
+        tokens += int(encoded['attention_mask'].sum())
+    return translations, tokens
+
+
+# Serve the texts of one language group from the cache and return the distinct texts that still need translating
+def _cache_lookup(cache, texts, language, backend, model_name):
+    distinct = list(dict.fromkeys(texts))
+    if cache is None:
+        return {}, distinct
+    keys = {text: cache.key(text, language, backend, model_name) for text in distinct}
+    found = cache.get_many(keys.values())
+    cached = {text: found[key] for text, key in keys.items() if key in found}
+    cache.saved_calls += len(texts) - len(distinct) + len(cached)
+    return cached, [text for text in distinct if text not in cached]
+
+
+# Translate every language group into the prefilled result list and print the source tokens per second reached
+# for each language. With a cache, each distinct text is translated once and successful translations are stored.
+def translate_groups(model, tokenizer, device, texts, translations, groups, source_codes, forced_bos_token_id,
+                     cache=None, backend=None, model_name=None, **generate_options):
+    for language, positions in groups.items():
+        source_code = source_codes(language)
+        if source_code is None:
+            print(f"Unsupported language for translation: {language}")
+            for i in positions:
+                translations[i] = (texts[i], language)
+            continue
+
+        done, pending = _cache_lookup(cache, [texts[i] for i in positions], language, backend, model_name)
+        start, tokens = time.perf_counter(), 0
+        if pending:
+            try:
+                tokenizer.src_lang = source_code
+                results, tokens = translate_batches(model, tokenizer, device, pending, forced_bos_token_id,
+                                                    **generate_options)
+                done.update(zip(pending, results))
+                if cache is not None:
+                    cache.put_many({cache.key(text, language, backend, model_name): translation
+                                    for text, translation in zip(pending, results)},
+                                   namespace=cache.namespace(backend, model_name))
+            except Exception as e:
+                print(f"Error during translation: {e}, Source Language: {language}")
+        seconds = time.perf_counter() - start
+        for i in positions:
+            translations[i] = (done.get(texts[i], ''), language)
+        print(f"Translated {len(pending):,} {language} texts ({len(positions) - len(pending):,} reused): "
+              f"{tokens / seconds if seconds else 0.0:.1f} tokens/sec")
+    return translations
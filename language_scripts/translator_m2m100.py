@@ -1,8 +1,9 @@
 from transformers import M2M100ForConditionalGeneration, M2M100Tokenizer
-from langdetect import detect
 import torch
 import re
-from tqdm import tqdm
+from language_scripts.translation_engine import BATCH_SIZE, NUM_BEAMS, MAX_NEW_TOKENS, group_by_language, \
+    translate_groups
+from language_scripts.translation_cache import get_translation_cache
 
 model_name = "facebook/m2m100_418M"
 model = M2M100ForConditionalGeneration.from_pretrained(model_name)
@@ -24,32 +25,19 @@ def clean_text(text):
     return re.sub(r'[^\w\s,.\-?!]', '', text)
 
 
-def translate_to_english_m2m100(texts):
-    translations = []
-    for text in tqdm(texts, desc="Translating"):
-        try:
-            text = clean_text(text)
-            # Ensure text is not empty
-            if not text.strip():
-                translations.append(('', 'unknown'))
-                continue
-
-            # Check if the text is already in English
-            if detect(text) == 'en':
-                translations.append((text, 'en'))
-                continue
-
-            # Tokenize and truncate/pad the text
-            detected_lang = detect(text)
-            tokenizer.src_lang = detected_lang
-            encoded_inputs = tokenizer(text, return_tensors="pt", padding="max_length", truncation=True, max_length=512)  # Adjust max_length as needed
-            encoded_inputs = encoded_inputs.to(device)
-
-            # Generate the translation
-            generated_tokens = model.generate(**encoded_inputs)
-            translation = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)[0]
-            translations.append(translation)
-        except Exception as e:
-            print(f"Skipping text due to error: {e}, Text: {text}, Source Language: {detected_lang}")
-            translations.append(('', detected_lang))  # Append empty string or handle the error as needed
-    return translations
+# Source language code if the tokenizer knows it
+def map_language_code(lang):
+    return lang if lang in tokenizer.lang_code_to_token else None
+
+
+# Translate texts to English in batches grouped by source language, each sorted by length and padded dynamically.
+# Languages that were already detected can be passed in, and translations are reused from the shared cache.
+# Returns a (translation, language) tuple per text.
+def translate_to_english_m2m100(texts, languages=None, batch_size=BATCH_SIZE, num_beams=NUM_BEAMS,
+                                max_new_tokens=MAX_NEW_TOKENS, use_cache=True):
+    texts = [clean_text(text) for text in texts]
+    translations, groups = group_by_language(texts, languages)
+    return translate_groups(model, tokenizer, device, texts, translations, groups, map_language_code,
+                            tokenizer.get_lang_id('en'), cache=get_translation_cache() if use_cache else None,
+                            backend='m2m100', model_name=model_name, batch_size=batch_size, num_beams=num_beams,
+                            max_new_tokens=max_new_tokens)
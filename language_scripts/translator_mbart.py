@@ -1,8 +1,9 @@
 from transformers import MBartForConditionalGeneration, MBart50TokenizerFast
-from langdetect import detect
 import re
 import torch
-from tqdm import tqdm
+from language_scripts.translation_engine import BATCH_SIZE, NUM_BEAMS, MAX_NEW_TOKENS, group_by_language, \
+    translate_groups
+from language_scripts.translation_cache import get_translation_cache
 
 model_name = "facebook/mbart-large-50-many-to-many-mmt"
 model = MBartForConditionalGeneration.from_pretrained(model_name)
@@ -36,32 +37,14 @@ def map_language_code(lang):
     return mbart_lang_codes.get(lang, None)
 
 
-def translate_to_english_mbart(texts):
-    translations = []
-    for text in tqdm(texts, desc="Translating"):
-        try:
-            text = clean_text(text)
-            if not text.strip():
-                translations.append(('', 'unknown'))
-                continue
-
-            detected_lang = detect(text)
-            src_lang_code = map_language_code(detected_lang)
-
-            if src_lang_code is None:
-                print(f"Unsupported language for translation: {detected_lang}")
-                translations.append((text, detected_lang))
-                continue
-
-            tokenizer.src_lang = src_lang_code
-            max_model_length = model.config.max_position_embeddings
-            encoded = tokenizer(text, return_tensors="pt", padding="max_length", truncation=True,
-                                max_length=max_model_length).to(device)
-            generated_tokens = model.generate(**encoded)
-            translation = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)[0]
-            translations.append((translation, detected_lang))
-        except Exception as e:
-            print(f"Error during translation: {e}, Text: {text}, Source Language: {detected_lang}")
-            translations.append(('', detected_lang))
-
-    return translations
+# Translate texts to English in batches grouped by source language, each sorted by length and padded dynamically.
+# Languages that were already detected can be passed in, and translations are reused from the shared cache.
+# Returns a (translation, language) tuple per text.
+def translate_to_english_mbart(texts, languages=None, batch_size=BATCH_SIZE, num_beams=NUM_BEAMS,
+                               max_new_tokens=MAX_NEW_TOKENS, use_cache=True):
+    texts = [clean_text(text) for text in texts]
+    translations, groups = group_by_language(texts, languages)
+    return translate_groups(model, tokenizer, device, texts, translations, groups, map_language_code,
+                            tokenizer.lang_code_to_id["en_XX"], cache=get_translation_cache() if use_cache else None,
+                            backend='mbart', model_name=model_name, batch_size=batch_size, num_beams=num_beams,
+                            max_new_tokens=max_new_tokens, max_length=model.config.max_position_embeddings)
@@ -1,18 +1,25 @@
-import os
-import langdetect
-from openai import OpenAI
 from tqdm import tqdm
+from language_scripts.detection_engine import detect_language
+from language_scripts.translation_cache import get_translation_cache
+from language_scripts.openai_engine import MODEL_NAME, CONCURRENCY, translate_texts, translate_texts_packed
 
-# Set API key
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-)
+model_name = MODEL_NAME
 
+# Distinct texts sent to the API per chunk; every chunk is cached as soon as it is back
+TRANSLATION_CHUNK = 200
 
-def translate_to_english_openai(data):
+
+# Translate the non-English rows of a DataFrame, reusing earlier translations of the same text from the shared
+# cache so that reruns do not pay for the same API call twice. The remaining texts are sent concurrently under the
+# engine's rate limits, in bounded chunks that are written to the cache as soon as they return, so an interrupted
+# run keeps every translation it has paid for; results come back in row order. In packing mode short texts share
+# requests.
+def translate_to_english_openai(data, use_cache=True, concurrency=CONCURRENCY, base_url=None, pack=False):
+    cache = get_translation_cache() if use_cache else None
     translations = []
+    pending = []
 
-    for index, row in tqdm(data.iterrows(), total=data.shape[0], desc="Translating"):
+    for index, row in tqdm(data.iterrows(), total=data.shape[0], desc="Detecting languages"):
         text = row['text']
         detected_lang = row.get('detected_language', None)
 
@@ -20,40 +27,46 @@ def translate_to_english_openai(data):
             translations.append({'index': index, 'translation': '', 'language': 'unknown'})
             continue
 
-        # Use pre-detected language if available
-        if detected_lang:
-            if detected_lang == 'en':
-                translations.append({'index': index, 'translation': text, 'language': detected_lang})
-                continue
-        else:
-            # Perform language detection if not already done
-            try:
-                detected_lang = langdetect.detect(text)
-                if detected_lang == 'en':
-                    translations.append({'index': index, 'translation': text, 'language': detected_lang})
-                    continue
-            except langdetect.lang_detect_exception.LangDetectException:
-                detected_lang = 'unknown'
-
-        # Translate the text if necessary
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You will be provided with a Text in an unkonwn language, and your task is to "
-                               "translate it into English."
-                },
-                {
-                    "role": "user",
-                    "content": text,
-                }
-            ],
-            temperature=0.5,
-            max_tokens=64,
-            top_p=1
-        )
-        translation = response.choices[0].message.content.strip()
-        translations.append({'index': index, 'translation': translation, 'language': detected_lang})
+        # Use the language stored by the preprocessing stage; detect only rows that were never preprocessed
+        if not detected_lang:
+            detected_lang = detect_language(text)
+        if detected_lang == 'en':
+            translations.append({'index': index, 'translation': text, 'language': detected_lang})
+            continue
+
+        translations.append({'index': index, 'translation': None, 'language': detected_lang})
+        pending.append((len(translations) - 1, text, detected_lang))
+
+    if cache is not None and pending:
+        keys = [cache.key(text, language, 'openai', model_name) for _, text, language in pending]
+        found = cache.get_many(keys)
+        for (position, _, _), key in zip(pending, keys):
+            if key in found:
+                translations[position]['translation'] = found[key]
+        cache.saved_calls += sum(key in found for key in keys)
+        pending = [item for item, key in zip(pending, keys) if key not in found]
+
+    # Translate the text if necessary, each distinct text and language once
+    distinct = list(dict.fromkeys((text, language) for _, text, language in pending))
+    translate = translate_texts_packed if pack else translate_texts
+    results = {}
+    for start in range(0, len(distinct), TRANSLATION_CHUNK):
+        chunk = distinct[start:start + TRANSLATION_CHUNK]
+        chunk_results = translate([text for text, _ in chunk], model_name=model_name, concurrency=concurrency,
+                                  base_url=base_url)
+        computed = {}
+        for (text, language), translation in zip(chunk, chunk_results):
+            if isinstance(translation, Exception):
+                print(f"Error during translation: {translation}, Text: {text}, Source Language: {language}")
+            elif cache is not None:
+                computed[cache.key(text, language, 'openai', model_name)] = translation
+        if computed:
+            cache.put_many(computed, namespace=cache.namespace('openai', model_name))
+        results.update(zip(chunk, chunk_results))
+    for position, text, language in pending:
+        translation = results[(text, language)]
+        translations[position]['translation'] = '' if isinstance(translation, Exception) else translation
+    if cache is not None:
+        cache.saved_calls += len(pending) - len(distinct)
 
     return translations
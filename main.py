@@ -4,35 +4,52 @@ from tqdm import tqdm
 from database.fetch_data import get_combined_data, fetch_table_data
 from language_scripts.translator_m2m100 import translate_to_english_m2m100
 from language_scripts.translator_mbart import translate_to_english_mbart
-from language_scripts.translator_openai import translate_to_english_openai
-from classification_scripts.inequality_classifier import classify_text
+from language_scripts.translator_openai import TRANSLATION_CHUNK, translate_to_english_openai
+from language_scripts.translation_cache import get_translation_cache
+from language_scripts.openai_engine import request_summary, packing_summary
+from classification_scripts.inequality_classifier import classify_text, device as classifier_device
+from classification_scripts.classifier_engine import warm_up, release
 
 
-def process_data(data, translation_func, classification_columns, filter_lang=None):
+# Translate the rows of a chunk in one call, so the translators can batch, deduplicate and cache across rows. The
+# language stored by the preprocessing stage is passed on, so no translator has to detect it again.
+def translate_data(data, translation_func):
+    if translation_func is translate_to_english_openai:
+        return [translation['translation'] for translation in translation_func(data)]
+    languages = data['detected_language'].tolist() if 'detected_language' in data else None
+    return [translation for translation, _ in translation_func(data['text'].astype(str).tolist(), languages)]
+
+
+# Translate and classify the rows in bounded chunks. The translations of a chunk are cached and its rows processed
+# before the next chunk is translated, so an interrupted run keeps (and a rerun reuses) everything already paid for.
+def process_data(data, translation_func, classification_columns, filter_lang=None, backend='torch', dtype=None,
+                 chunk_size=TRANSLATION_CHUNK):
     processed_data = []
     try:
-        for index, row in tqdm(data.iterrows(), total=data.shape[0], desc="Processing rows"):
-            if filter_lang and row.get('detected_language') != filter_lang:
-                continue
-            text = str(row['text'])
-            print(f"Processing row {index}, Post ID: {row['id']} from Table: {row['source_table']}")
-            if text.strip():
-                translation_result = translation_func(data.loc[data.index == index])
-                translated_text = translation_result[0]['translation']
-                detected_lang = translation_result[0]['language']
-
+        if filter_lang:
+            data = data[data['detected_language'] == filter_lang] if 'detected_language' in data else data.iloc[0:0]
+        data = data[data['text'].astype(str).str.strip() != '']
+        pbar = tqdm(total=data.shape[0], desc="Processing rows")
+        for start in range(0, data.shape[0], chunk_size):
+            chunk = data.iloc[start:start + chunk_size]
+            translations = translate_data(chunk, translation_func)
+            for (index, row), translated_text in zip(chunk.iterrows(), translations):
+                print(f"Processing row {index}, Post ID: {row['id']} from Table: {row['source_table']}")
                 if translated_text.strip():
-                    classification_scores = classify_text(translated_text, classification_columns)
+                    classification_scores = classify_text(translated_text, classification_columns,
+                                                          backend=backend, dtype=dtype)
                     for column in classification_columns:
                         row[column] = classification_scores.get(column, 0)
                 processed_data.append(row)
+                pbar.update(1)
+        pbar.close()
     except KeyboardInterrupt:
         print("Interrupted during data processing. Saving what has been processed so far.")
     return pd.DataFrame(processed_data)
 
 
 def main(use_csv=False, csv_path=None, process_combined=False, row_limit=None, translation_choice="openai",
-         filter_lang=None):
+         filter_lang=None, backend='torch', dtype=None):
     translation_funcs = {
         "openai": translate_to_english_openai,
         "mbart": translate_to_english_mbart,
@@ -42,6 +59,9 @@ def main(use_csv=False, csv_path=None, process_combined=False, row_limit=None, t
     classification_columns = ['top_bottom_inequalities', 'inside_outside_inequalities', 'us_them_inequalities',
                               'today_tomorrow_inequalities']
 
+    print(f"Using device: {classifier_device}")
+    warm_up(device=classifier_device, dtype=dtype, backend=backend)
+
     try:
         if use_csv:
             print("Processing data from CSV...")
@@ -60,11 +80,12 @@ def main(use_csv=False, csv_path=None, process_combined=False, row_limit=None, t
                 for table_name in table_names:
                     print(f"Fetching {table_name} from database...")
                     data = fetch_table_data(table_name, row_limit)
-                    temp_processed = process_data(data, translation_func, classification_columns, filter_lang)
+                    temp_processed = process_data(data, translation_func, classification_columns, filter_lang, backend,
+                                                  dtype)
                     processed_data = pd.concat([processed_data, temp_processed])
                 base_name = "individual_tables"
 
-        processed_data = process_data(data, translation_func, classification_columns, filter_lang)
+        processed_data = process_data(data, translation_func, classification_columns, filter_lang, backend, dtype)
 
     except KeyboardInterrupt:
         print("Interrupted! Saving processed data so far...")
@@ -73,6 +94,11 @@ def main(use_csv=False, csv_path=None, process_combined=False, row_limit=None, t
         filename = f"{base_name}_processed_{timestamp}.csv"
         processed_data.to_csv(filename, index=False)
         print(f"Processed data saved to {filename}")
+        print(f"Translation cache: {get_translation_cache().stats()}")
+        if translation_choice == "openai":
+            print(request_summary())
+            print(packing_summary())
+        release()
 
 
 if __name__ == "__main__":